@@ -1,10 +1,17 @@
+import copy
+import functools
 import json
 from pathlib import Path
 import os
 import sys
+import threading
 
 DEBUG = False
 
+# Pool threads read config.json while the GUI writes it: every
+# read-modify-write holds this lock and files are replaced atomically
+_lock = threading.RLock()
+
 # Resolve app directory (works for dev and PyInstaller onefile)
 if getattr(sys, 'frozen', False):
     APP_DIR = Path(sys.executable).parent
@@ -34,55 +41,193 @@ def _default_backup_dir() -> Path:
     # Dev: store inside project folder
     return APP_DIR / 'backup'
 
-DEFAULT_CONFIG = {
+DEFAULT_PROFILE = "default"
+
+# Per-profile settings; every profile shares the same backup_dir
+DEFAULT_PROFILE_CONFIG = {
     "source_dir": rf"C:\Users\{CURRENT_USER}\AppData\Roaming\Claude\Network",
-    "backup_dir": str(_default_backup_dir()),
     "claude_path": rf"C:\Users\{CURRENT_USER}\AppData\Roaming\Microsoft\Windows\Start Menu\Programs\Anthropic\Claude.lnk",
     "current_backup": ""
 }
 
+DEFAULT_CONFIG = {
+    "backup_dir": str(_default_backup_dir()),
+    "active_profile": DEFAULT_PROFILE,
+    "profiles": {DEFAULT_PROFILE: dict(DEFAULT_PROFILE_CONFIG)},
+    "io_workers": 4,
+    # "local" keeps backups in backup_dir; "s3" also takes bucket, prefix,
+    # endpoint_url, region, access_key, secret_key and chunk_size_mb
+    "storage": {"type": "local"},
+    # Pre-staged restore cache next to each profile's source_dir
+    "stage_count": 3,
+    "stage_budget_mb": 2048,
+    # Passphrase-based backup encryption; the passphrase itself is never stored
+    "encryption": {"enabled": False, "salt": "", "check": ""},
+    # Shared budget for background I/O (0 = unlimited / off)
+    "io_limit": {"mb_per_sec": 0, "files_per_sec": 0, "low_priority": False, "backoff_latency_ms": 0}
+}
+
+def _migrate(config):
+    """Move pre-profile top-level keys into the default profile"""
+    profiles = config.setdefault("profiles", {})
+    legacy = {k: config.pop(k) for k in list(DEFAULT_PROFILE_CONFIG) if k in config}
+    if legacy or not profiles:
+        profile = profiles.setdefault(DEFAULT_PROFILE, dict(DEFAULT_PROFILE_CONFIG))
+        profile.update(legacy)
+    if config.get("active_profile") not in profiles:
+        config["active_profile"] = next(iter(profiles))
+    return config
+
+def _locked(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+@_locked
 def load_config():
     """Load configuration from file"""
     if CONFIG_FILE.exists():
         try:
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+                config = _migrate(json.load(f))
                 # Ensure backup_dir exists
                 Path(config.get("backup_dir", DEFAULT_CONFIG["backup_dir"])).mkdir(exist_ok=True, parents=True)
                 return config
         except Exception as e:
             if DEBUG:
                 print(f"Error loading config: {e}")
-            return DEFAULT_CONFIG.copy()
-    return DEFAULT_CONFIG.copy()
+            return copy.deepcopy(DEFAULT_CONFIG)
+    return copy.deepcopy(DEFAULT_CONFIG)
 
+@_locked
 def save_config(config):
-    """Save configuration to file"""
+    """Save configuration to file (readers never see a half-written file)"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+        tmp = CONFIG_FILE.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=2)
+        os.replace(tmp, CONFIG_FILE)
         return True
     except Exception as e:
         if DEBUG:
             print(f"Error saving config: {e}")
         return False
 
-def get_source_dir():
+def _profile(config, profile=None):
+    """Return the settings dict of a profile (active profile by default)"""
+    name = profile or config.get("active_profile") or DEFAULT_PROFILE
+    if name not in config["profiles"]:
+        raise KeyError(f"Unknown profile: {name}")
+    return config["profiles"][name]
+
+def list_profiles():
+    """List profile names"""
+    return list(load_config()["profiles"])
+
+def get_active_profile():
+    """Get the active profile name"""
+    return load_config()["active_profile"]
+
+@_locked
+def set_active_profile(name):
+    """Switch the active profile"""
+    config = load_config()
+    _profile(config, name)
+    config["active_profile"] = name
+    return save_config(config)
+
+@_locked
+def add_profile(name, source_dir=None, claude_path=None):
+    """Add a profile, defaulting its paths to the active profile's"""
+    config = load_config()
+    if name in config["profiles"]:
+        raise ValueError(f"Profile already exists: {name}")
+    active = _profile(config)
+    config["profiles"][name] = {
+        "source_dir": source_dir or active.get("source_dir", DEFAULT_PROFILE_CONFIG["source_dir"]),
+        "claude_path": claude_path or active.get("claude_path", DEFAULT_PROFILE_CONFIG["claude_path"]),
+        "current_backup": ""
+    }
+    return save_config(config)
+
+@_locked
+def remove_profile(name):
+    """Remove a profile (the last remaining profile cannot be removed)"""
+    config = load_config()
+    _profile(config, name)
+    if len(config["profiles"]) == 1:
+        raise ValueError("Cannot remove the last profile")
+    del config["profiles"][name]
+    if config["active_profile"] == name:
+        config["active_profile"] = next(iter(config["profiles"]))
+    return save_config(config)
+
+def get_io_workers():
+    """Get the size of the shared I/O thread pool"""
+    config = load_config()
+    return max(1, int(config.get("io_workers", DEFAULT_CONFIG["io_workers"])))
+
+def get_storage():
+    """Get storage backend settings"""
+    config = load_config()
+    return config.get("storage") or dict(DEFAULT_CONFIG["storage"])
+
+def get_stage_count():
+    """Get how many hot backups to keep staged for instant switching"""
+    config = load_config()
+    return max(0, int(config.get("stage_count", DEFAULT_CONFIG["stage_count"])))
+
+def get_stage_budget_mb():
+    """Get the disk budget of the staged restore cache"""
+    config = load_config()
+    return max(0, int(config.get("stage_budget_mb", DEFAULT_CONFIG["stage_budget_mb"])))
+
+def get_encryption():
+    """Get backup encryption settings"""
+    config = load_config()
+    return config.get("encryption") or dict(DEFAULT_CONFIG["encryption"])
+
+@_locked
+def set_encryption(settings):
+    """Set backup encryption settings"""
+    config = load_config()
+    config["encryption"] = settings
+    return save_config(config)
+
+def get_io_limit():
+    """Get background I/O budget settings"""
+    config = load_config()
+    limit = dict(DEFAULT_CONFIG["io_limit"])
+    limit.update(config.get("io_limit") or {})
+    return limit
+
+@_locked
+def set_io_limit(settings):
+    """Set background I/O budget settings"""
+    config = load_config()
+    config["io_limit"] = settings
+    return save_config(config)
+
+def get_source_dir(profile=None):
     """Get source directory from config"""
     config = load_config()
-    return config.get("source_dir", DEFAULT_CONFIG["source_dir"])
+    return _profile(config, profile).get("source_dir", DEFAULT_PROFILE_CONFIG["source_dir"])
 
 def get_backup_dir():
     """Get backup directory from config"""
     config = load_config()
     return config.get("backup_dir", DEFAULT_CONFIG["backup_dir"])
 
-def set_source_dir(path):
+@_locked
+def set_source_dir(path, profile=None):
     """Set source directory in config"""
     config = load_config()
-    config["source_dir"] = path
+    _profile(config, profile)["source_dir"] = path
     return save_config(config)
 
+@_locked
 def set_backup_dir(path):
     """Set backup directory in config"""
     config = load_config()
@@ -91,24 +236,26 @@ def set_backup_dir(path):
     Path(path).mkdir(exist_ok=True, parents=True)
     return save_config(config)
 
-def get_claude_path():
+def get_claude_path(profile=None):
     """Get Claude executable/shortcut path from config"""
     config = load_config()
-    return config.get("claude_path", DEFAULT_CONFIG["claude_path"])
+    return _profile(config, profile).get("claude_path", DEFAULT_PROFILE_CONFIG["claude_path"])
 
-def set_claude_path(path):
+@_locked
+def set_claude_path(path, profile=None):
     """Set Claude executable/shortcut path in config"""
     config = load_config()
-    config["claude_path"] = path
+    _profile(config, profile)["claude_path"] = path
     return save_config(config)
 
-def get_current_backup():
+def get_current_backup(profile=None):
     """Get the last restored/active backup name"""
     config = load_config()
-    return config.get("current_backup", DEFAULT_CONFIG["current_backup"]) or ""
+    return _profile(config, profile).get("current_backup", DEFAULT_PROFILE_CONFIG["current_backup"]) or ""
 
-def set_current_backup(name: str):
+@_locked
+def set_current_backup(name: str, profile=None):
     """Set the last restored/active backup name"""
     config = load_config()
-    config["current_backup"] = name or ""
+    _profile(config, profile)["current_backup"] = name or ""
     return save_config(config)
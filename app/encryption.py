@@ -0,0 +1,328 @@
+import json
+import os
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import config, throttle
+except:
+    import config, throttle
+
+# Encrypted file layout:
+#   header = MAGIC | chunk_size (u32) | file salt (16 bytes)
+#   then one AES-256-GCM record per chunk: ciphertext + 16 byte tag
+# Every file is sealed with its own subkey, HKDF(backup key, file salt), so
+# nonces never repeat across files however many share the backup key.
+# Chunk i uses nonce = i (96-bit counter) and authenticates the header,
+# its index and a final-chunk flag, so chunks cannot be reordered, swapped
+# between files or truncated. Every chunk is independent, which lets the
+# CPU pool seal/open them in parallel while the file streams through.
+MAGIC = b"CBMENC2\0"
+HEADER = struct.Struct(">8sI16s")
+# First format: backup key used directly, nonce = 8 random bytes | i (u32).
+# Still readable, never written.
+MAGIC_V1 = b"CBMENC1\0"
+HEADER_V1 = struct.Struct(">8sI8s")
+TAG_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+MARKER = ".cbm-encryption.json"
+CHECK_PLAINTEXT = b"claude-backup-manager"
+
+_cpu_pool = None
+_cpu_lock = threading.Lock()
+_keys = {}
+_passphrases = []
+
+
+def _aesgcm():
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError:
+        raise RuntimeError("Encryption requires the cryptography package (pip install cryptography)")
+    return AESGCM
+
+
+def _pool():
+    # Separate from the I/O pool: crypto tasks are pure CPU and never block
+    # on other tasks, so nesting them under file-level I/O work is safe.
+    global _cpu_pool
+    with _cpu_lock:
+        if _cpu_pool is None:
+            _cpu_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="crypto")
+        return _cpu_pool
+
+
+# keys
+
+def derive_key(passphrase, salt):
+    _aesgcm()
+    from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+    return Scrypt(salt=salt, length=32, n=2 ** 15, r=8, p=1).derive(passphrase.encode("utf-8"))
+
+
+def _check_value(key):
+    nonce = os.urandom(12)
+    return (nonce + _aesgcm()(key).encrypt(nonce, CHECK_PLAINTEXT, None)).hex()
+
+
+def _verify(key, check):
+    raw = bytes.fromhex(check)
+    try:
+        return _aesgcm()(key).decrypt(raw[:12], raw[12:], None) == CHECK_PLAINTEXT
+    except Exception:
+        return False
+
+
+def _known(enc):
+    """(salt, check) of the current passphrase and of every one it replaced"""
+    known = [(p["salt"], p["check"]) for p in enc.get("previous", [])]
+    if enc.get("salt") and enc.get("check"):
+        known.insert(0, (enc["salt"], enc["check"]))
+    return known
+
+
+def setup(passphrase, current=None):
+    """Enable encryption for new backups.
+    Once a passphrase exists it can only be changed by also giving the
+    `current` one; the old salt/check is kept so backups made under it can
+    still be unlocked with the old passphrase.
+    """
+    enc = config.get_encryption()
+    previous = list(enc.get("previous", []))
+    if enc.get("salt") and enc.get("check"):
+        if current is None or not _verify(derive_key(current, bytes.fromhex(enc["salt"])), enc["check"]):
+            raise ValueError("The current passphrase is required to change it")
+        if passphrase == current:
+            config.set_encryption({**enc, "enabled": True})
+            unlock(passphrase)
+            return
+        previous.append({"salt": enc["salt"], "check": enc["check"]})
+    salt = os.urandom(16)
+    key = derive_key(passphrase, salt)
+    config.set_encryption({"enabled": True, "salt": salt.hex(), "check": _check_value(key), "previous": previous})
+    if current is not None:
+        unlock(current)
+    unlock(passphrase)
+
+
+def unlock(passphrase):
+    """Remember a passphrase for this session; False if it matches neither
+    the current passphrase nor one it replaced. Call again with an older
+    passphrase to unlock backups made before a change.
+    """
+    if passphrase in _passphrases:
+        return True
+    known = _known(config.get_encryption())
+    matched = False
+    for salt, check in known:
+        if salt in _keys:
+            continue
+        key = derive_key(passphrase, bytes.fromhex(salt))
+        if _verify(key, check):
+            _keys[salt] = key
+            matched = True
+    if not matched and known:
+        return False
+    if passphrase not in _passphrases:
+        _passphrases.append(passphrase)
+    return True
+
+
+def is_unlocked():
+    """True once a passphrase has been entered this session"""
+    return bool(_passphrases)
+
+
+def key_for(marker):
+    """Key for a backup, from the salt recorded in its marker"""
+    salt = marker["salt"]
+    if salt in _keys:
+        return _keys[salt]
+    if not _passphrases:
+        raise RuntimeError("Backup is encrypted: unlock with your passphrase first")
+    for passphrase in _passphrases:
+        key = derive_key(passphrase, bytes.fromhex(salt))
+        if not marker.get("check") or _verify(key, marker["check"]):
+            _keys[salt] = key
+            return key
+    raise RuntimeError("Wrong passphrase for this backup: unlock with the passphrase it was made with")
+
+
+def write_marker():
+    """Return (marker dict, key) for a new encrypted backup, or (None, None)"""
+    enc = config.get_encryption()
+    if not enc.get("enabled"):
+        return None, None
+    marker = {"version": 2, "cipher": "AES-256-GCM", "chunk_size": CHUNK_SIZE,
+              "salt": enc["salt"], "check": enc["check"]}
+    return marker, key_for(marker)
+
+
+def seal_text(text, marker):
+    """Encrypt a short string under the key of `marker`'s backup"""
+    nonce = os.urandom(12)
+    data = _aesgcm()(key_for(marker)).encrypt(nonce, text.encode("utf-8"), None)
+    return {"salt": marker["salt"], "data": (nonce + data).hex()}
+
+
+def open_text(sealed):
+    """Decrypt seal_text output; None while its key is locked (or on tampering)"""
+    key = _keys.get(sealed.get("salt"))
+    if key is None:
+        return None
+    raw = bytes.fromhex(sealed["data"])
+    try:
+        return _aesgcm()(key).decrypt(raw[:12], raw[12:], None).decode("utf-8")
+    except Exception:
+        return None
+
+
+def marker_bytes(marker):
+    return json.dumps(marker, indent=2).encode("utf-8")
+
+
+def read_marker(data):
+    return json.loads(data.decode("utf-8"))
+
+
+# streams
+
+def encrypted_size(size, chunk_size=CHUNK_SIZE):
+    chunks = max(1, -(-size // chunk_size))
+    return HEADER.size + size + chunks * TAG_SIZE
+
+
+def _aad(header, index, final):
+    return header + struct.pack(">Q?", index, final)
+
+
+def _file_cipher(key, file_salt):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    subkey = HKDF(algorithm=hashes.SHA256(), length=32, salt=file_salt, info=b"cbm-file-key").derive(key)
+    return _aesgcm()(subkey)
+
+
+def _nonce(index):
+    return struct.pack(">4xQ", index)
+
+
+def _ordered(jobs, window):
+    """Yield results of a job generator in order, keeping `window` in flight"""
+    pool = _pool()
+    fg = throttle.is_foreground()
+    pending = deque()
+    for fn, args in jobs:
+        pending.append(pool.submit(throttle.run_as, fg, fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def encrypt_stream(fin, key, chunk_size=CHUNK_SIZE):
+    """Yield the encrypted form of the readable binary stream fin"""
+    file_salt = os.urandom(16)
+    aes = _file_cipher(key, file_salt)
+    header = HEADER.pack(MAGIC, chunk_size, file_salt)
+    yield header
+
+    def jobs():
+        index = 0
+        data = fin.read(chunk_size)
+        while True:
+            nxt = fin.read(chunk_size) if len(data) == chunk_size else b""
+            final = not nxt
+            yield aes.encrypt, (_nonce(index), data, _aad(header, index, final))
+            if final:
+                return
+            index += 1
+            data = nxt
+
+    yield from _ordered(jobs(), 2 * (os.cpu_count() or 2))
+
+
+def decrypt_stream(fin, key):
+    """Yield the plaintext of an encrypted binary stream, verifying every chunk"""
+    magic = fin.read(len(MAGIC))
+    layout = {MAGIC: HEADER, MAGIC_V1: HEADER_V1}.get(magic)
+    if layout is None:
+        raise ValueError("Not an encrypted backup file")
+    header = magic + fin.read(layout.size - len(magic))
+    if len(header) != layout.size:
+        raise ValueError("Encrypted file is truncated")
+    _, chunk_size, file_salt = layout.unpack(header)
+    if magic == MAGIC:
+        aes, nonce = _file_cipher(key, file_salt), _nonce
+    else:
+        aes, nonce = _aesgcm()(key), lambda i: file_salt + struct.pack(">I", i)
+    record = chunk_size + TAG_SIZE
+
+    def open_chunk(nonce, data, aad):
+        try:
+            return aes.decrypt(nonce, data, aad)
+        except Exception:
+            raise ValueError("Backup data is corrupted or the passphrase is wrong")
+
+    def jobs():
+        index = 0
+        data = fin.read(record)
+        while True:
+            if len(data) < TAG_SIZE:
+                raise ValueError("Encrypted file is truncated")
+            nxt = fin.read(record) if len(data) == record else b""
+            final = not nxt
+            yield open_chunk, (nonce(index), data, _aad(header, index, final))
+            if final:
+                return
+            index += 1
+            data = nxt
+
+    yield from _ordered(jobs(), 2 * (os.cpu_count() or 2))
+
+
+def encrypt_file(src, dst, key):
+    throttle.consume(nfiles=1)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for block in encrypt_stream(fin, key):
+            throttle.consume(len(block))
+            fout.write(block)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+
+def decrypt_file(src, dst, key):
+    throttle.consume(nfiles=1)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for block in decrypt_stream(fin, key):
+            throttle.consume(len(block))
+            fout.write(block)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+
+class StreamReader:
+    """File-like read() over a block iterator (for tarfile.addfile)"""
+
+    def __init__(self, blocks):
+        self._blocks = iter(blocks)
+        self._block = b""
+        self._pos = 0
+
+    def read(self, size=-1):
+        out = []
+        while size != 0:
+            if self._pos >= len(self._block):
+                try:
+                    self._block, self._pos = next(self._blocks), 0
+                except StopIteration:
+                    break
+                continue
+            end = len(self._block) if size < 0 else min(len(self._block), self._pos + size)
+            out.append(self._block[self._pos:end])
+            if size > 0:
+                size -= end - self._pos
+            self._pos = end
+        return b"".join(out)
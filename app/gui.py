@@ -11,60 +11,207 @@ from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 
 try:
-    from . import config
+    from . import config, encryption, iopool, journal, metadata, staging, storage, throttle
 except:
-    import config
+    import config, encryption, iopool, journal, metadata, staging, storage, throttle
 
-def create_backup(name="claude"):
-    source = config.get_source_dir()
-    backup_dir = Path(config.get_backup_dir())
+def create_backup(name="claude", profile=None):
+    profile = profile or config.get_active_profile()
+    source = config.get_source_dir(profile)
     if not os.path.exists(source):
         raise FileNotFoundError(f"Source not found: {source}")
-    backup_dir.mkdir(exist_ok=True, parents=True)
+    if config.get_encryption().get("enabled") and not encryption.is_unlocked():
+        raise RuntimeError("Backups are encrypted: unlock with your passphrase first")
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_name = f"backup-{name}-{timestamp}"
-    shutil.copytree(source, backup_dir / backup_name)
+    j = journal.start("create", backup_name, profile=profile, source=source)
+    storage.get_backend().put(backup_name, source, j)
+    j.finish()
+    metadata.capture(backup_name, source, profile)
     return backup_name
 
 def list_backups():
-    backup_dir = Path(config.get_backup_dir())
-    if not backup_dir.exists():
-        return []
-    backups = []
-    for item in backup_dir.iterdir():
-        if item.is_dir() and item.name.startswith("backup-"):
-            try:
-                backups.append({
-                    "name": item.name,
-                    "created": datetime.fromtimestamp(item.stat().st_ctime),
-                    "size": sum(f.stat().st_size for f in item.rglob('*') if f.is_file())
-                })
-            except:
-                pass
-    backups.sort(key=lambda x: x["created"], reverse=True)
-    return backups
+    return metadata.attach(storage.get_backend().list())
 
-def restore_backup(backup_name):
-    source = config.get_source_dir()
-    backup_path = Path(config.get_backup_dir()) / backup_name
-    if not backup_path.exists():
-        raise FileNotFoundError(f"Backup not found")
-    if os.path.exists(source):
-        shutil.rmtree(source)
-    shutil.copytree(backup_path, source)
+def collect_backups():
+    """Everything the backup table shows: (backups, current name, staged names)"""
+    bs = list_backups()
+    try:
+        cur = config.get_current_backup()
+    except Exception:
+        cur = None
+    try:
+        hot = set(staging.staged_names())
+    except Exception:
+        hot = set()
+    return bs, cur, hot
 
-def delete_backup(backup_name):
-    backup_path = Path(config.get_backup_dir()) / backup_name
-    if not backup_path.exists():
+def snapshot_all_profiles():
+    """Back up every profile concurrently on the shared I/O pool.
+    Returns a list of (profile, backup_name or None, error or None).
+    """
+    results = iopool.run_all(lambda p: create_backup(p, p), config.list_profiles())
+    return [(p, name, str(e) if e else None) for p, name, e in results]
+
+def restore_backup(backup_name, profile=None):
+    """Restore a backup, by rename when a staged copy is ready.
+    Returns True when the fast (staged) path was taken.
+    """
+    profile = profile or config.get_active_profile()
+    source = config.get_source_dir(profile)
+    _supersede_restores(source)
+    staging.record_restore(backup_name, profile)
+    if _while_locked(staging.swap_in, backup_name, profile):
+        staging.refresh_async(profile)
+        return True
+    if not storage.get_backend().exists(backup_name):
         raise FileNotFoundError(f"Backup not found")
-    import time
-    for i in range(3):
+    incoming = Path(f"{source}.incoming")
+    if incoming.exists():
+        shutil.rmtree(incoming)
+    j = journal.start("restore", backup_name, profile=profile, source=source)
+    _fetch_and_swap(j)
+    staging.refresh_async(profile)
+    return False
+
+def _supersede_restores(source):
+    # A new restore supersedes an interrupted one into the same folder
+    for j in journal.pending():
+        if j.op == "restore" and j.header.get("source") == source:
+            j.finish()
+
+def switch_to_backup(backup_name, profile=None, relaunch=True):
+    """Switch accounts in one pipeline: stage the backup while Claude keeps
+    running, terminate Claude by cached PID, swap the staged copy in by
+    rename and relaunch. Returns the duration of each phase in seconds.
+    The user is waiting on this, so it bypasses the background I/O budget.
+    """
+    with throttle.foreground():
+        return _switch(backup_name, profile, relaunch)
+
+def _switch(backup_name, profile, relaunch):
+    profile = profile or config.get_active_profile()
+    source = config.get_source_dir(profile)
+    timings = {}
+    start = mark = time.perf_counter()
+
+    def lap(phase):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[phase] = now - mark
+        mark = now
+
+    _supersede_restores(source)
+    staging.record_restore(backup_name, profile)
+    # Pinned so a concurrent refresh cannot evict the copy before the swap
+    with staging.pinned(backup_name, profile):
+        staging.stage(backup_name, profile)
+        lap("stage")
+        terminate_claude(procs=cached_claude_procs())
+        lap("terminate")
         try:
-            shutil.rmtree(backup_path)
-            return
-        except:
-            time.sleep(0.3)
-    raise RuntimeError("Cannot delete")
+            _swap_staged(backup_name, profile)
+        except Exception:
+            if relaunch:
+                start_claude(profile)  # back on the data it had
+            raise
+    lap("swap")
+    config.set_current_backup(backup_name, profile)
+    if relaunch and not start_claude(profile):
+        raise RuntimeError("Switched, but could not start Claude")
+    lap("launch")
+    staging.refresh_async(profile)
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+def _while_locked(func, *args):
+    """Call func, retrying while Claude's data folder is still locked.
+    File handles can linger for a moment after the process exits.
+    """
+    for attempt in range(100):
+        try:
+            return func(*args)
+        except PermissionError:
+            if attempt == 10:
+                terminate_claude()  # PID cache was stale: rescan
+            time.sleep(0.02)
+    raise RuntimeError("Claude data folder is still in use")
+
+def _swap_staged(backup_name, profile):
+    if not _while_locked(staging.swap_in, backup_name, profile):
+        raise RuntimeError("Staged copy was evicted, try again")
+
+def after_closing_claude(close, func, *args):
+    """Run func(*args), terminating Claude first when `close` is set, so the
+    wait for Claude to exit happens off the GUI thread.
+    Returns (processes terminated or None, result).
+    """
+    count = terminate_claude() if close else None
+    return count, func(*args)
+
+def _fetch_and_swap(j):
+    # Fetch next to the target first so a failed or interrupted fetch never
+    # leaves the Network folder deleted or half-written
+    source = Path(j.header["source"])
+    incoming = Path(f"{source}.incoming")
+    old = Path(f"{source}.old")
+    if j.phase != "swap":
+        storage.get_backend().get(j.name, incoming, j)
+        j.set_phase("swap")
+    _while_locked(_swap_incoming, source, incoming, old)
+    shutil.rmtree(old, ignore_errors=True)
+    j.finish()
+
+def _swap_incoming(source, incoming, old):
+    # Safe to repeat after a failure at either rename
+    if incoming.exists():
+        if source.exists():
+            if old.exists():
+                shutil.rmtree(old)
+            os.replace(source, old)
+        os.replace(incoming, source)
+
+def resume_operation(j):
+    """Finish an interrupted create/restore, skipping files already done"""
+    if j.op == "create":
+        storage.get_backend().put(j.name, j.header["source"], j)
+        j.finish()
+        metadata.capture(j.name, j.header["source"], j.profile)
+    elif j.op == "restore":
+        _fetch_and_swap(j)
+        try:
+            config.set_current_backup(j.name, j.profile)
+        except Exception:
+            pass
+    return j.name
+
+def rollback_operation(j):
+    """Undo an interrupted create/restore, leaving things as before it started"""
+    if j.op == "create":
+        storage.get_backend().discard_partial(j.name)
+    elif j.op == "restore":
+        source = Path(j.header["source"])
+        old = Path(f"{source}.old")
+        if not source.exists() and old.exists():
+            os.replace(old, source)
+        elif source.exists() and old.exists() and not Path(f"{source}.incoming").exists():
+            # crashed after the swap: the restore is already complete
+            shutil.rmtree(old, ignore_errors=True)
+        shutil.rmtree(f"{source}.incoming", ignore_errors=True)
+    j.finish()
+    return j.name
+
+def delete_backup(backup_name):
+    storage.get_backend().delete(backup_name)
+    metadata.forget(backup_name)
+    # A staged copy would otherwise still "restore" the deleted backup
+    for profile in config.list_profiles():
+        staging.forget(backup_name, profile)
+
+def get_time_str(iso):
+    if not iso:
+        return ""
+    return datetime.fromisoformat(iso).strftime("%Y-%m-%d %H:%M")
 
 def get_size_str(size_bytes):
     for unit in ['B', 'KB', 'MB', 'GB']:
@@ -73,19 +220,29 @@ def get_size_str(size_bytes):
         size_bytes /= 1024
     return f"{size_bytes:.1f} TB"
 
+# PIDs seen by the last is_claude_running() scan, so a switch can
+# terminate Claude without scanning the whole process table again
+_claude_pids = set()
+
 def is_claude_running():
-    """Check if Claude app is running (match exact image name, exclude self)."""
-    self_pid = os.getpid()
-    for proc in psutil.process_iter(['name','pid']):
+    """Check if Claude app is running (match exact image name, exclude self).
+    Also refreshes the cached Claude PIDs.
+    """
+    global _claude_pids
+    _claude_pids = {p.pid for p in iter_claude_procs()}
+    return bool(_claude_pids)
+
+def cached_claude_procs():
+    """Claude processes from the cached PIDs (dropping exited/reused ones)"""
+    procs = []
+    for pid in list(_claude_pids):
         try:
-            if proc.info.get('pid') == self_pid:
-                continue
-            name = (proc.info.get('name') or '').lower()
-            if name == 'claude.exe':
-                return True
+            p = psutil.Process(pid)
+            if p.name().lower() == 'claude.exe':
+                procs.append(p)
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             pass
-    return False
+    return procs
 
 def iter_claude_procs():
     self_pid = os.getpid()
@@ -100,11 +257,12 @@ def iter_claude_procs():
             continue
 
 
-def terminate_claude(timeout: float = 3.0) -> int:
+def terminate_claude(timeout: float = 3.0, procs=None) -> int:
     """Terminate Claude processes gracefully, then force kill if needed.
     Returns number of processes targeted.
     """
-    procs = list(iter_claude_procs())
+    if procs is None:
+        procs = list(iter_claude_procs())
     if not procs:
         return 0
     # Try graceful terminate
@@ -128,13 +286,12 @@ def terminate_claude(timeout: float = 3.0) -> int:
             subprocess.run(["taskkill","/IM","Claude.exe","/F","/T"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         except Exception:
             pass
-    time.sleep(0.5)
     return len(procs)
 
-def start_claude():
+def start_claude(profile=None):
     """Start Claude app"""
     # Try config path first
-    config_path = config.get_claude_path()
+    config_path = config.get_claude_path(profile)
     if config_path and os.path.exists(config_path):
         try:
             os.startfile(config_path)
@@ -172,6 +329,8 @@ class Worker(QThread):
             self.error.emit(str(e))
 
 class App(QMainWindow):
+    status_ready = pyqtSignal(bool)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Claude Backup Manager")
@@ -180,9 +339,14 @@ class App(QMainWindow):
         self.setup_ui()
         self.apply_theme()
         self.log("App started")
+        if config.get_encryption().get("enabled"):
+            self.unlock_encryption()
         self.load_backups()
+        self.recover_operations()
         
         # realtime status timer
+        self.status_future = None
+        self.status_ready.connect(self.show_status)
         self.status_timer = QTimer(self)
         self.status_timer.timeout.connect(self.update_status)
         self.status_timer.start(1000)
@@ -198,11 +362,18 @@ class App(QMainWindow):
         menu = self.menuBar()
         fm = menu.addMenu("File")
         a=QAction("Refresh",self);a.setShortcut("F5");a.triggered.connect(self.load_backups);fm.addAction(a)
+        a=QAction("Snapshot All Profiles",self);a.triggered.connect(self.do_snapshot_all);fm.addAction(a)
         fm.addSeparator()
         a=QAction("Exit",self);a.triggered.connect(self.close);fm.addAction(a)
         vm = menu.addMenu("View")
         a=QAction("Open Source",self);a.triggered.connect(lambda: subprocess.run(["explorer", config.get_source_dir()]));vm.addAction(a)
         a=QAction("Open Backup",self);a.triggered.connect(lambda: subprocess.run(["explorer", config.get_backup_dir()]));vm.addAction(a)
+        pm = menu.addMenu("Performance")
+        a=QAction("Background I/O Limits…",self);a.triggered.connect(self.edit_io_limits);pm.addAction(a)
+        em = menu.addMenu("Security")
+        a=QAction("Enable Encryption…",self);a.triggered.connect(self.enable_encryption);em.addAction(a)
+        a=QAction("Unlock…",self);a.triggered.connect(self.unlock_encryption);em.addAction(a)
+        a=QAction("Disable Encryption",self);a.triggered.connect(self.disable_encryption);em.addAction(a)
         
         top = QWidget()
         top.setObjectName("topbar")
@@ -210,6 +381,22 @@ class App(QMainWindow):
         tl.setContentsMargins(16,12,16,12)
         tl.setSpacing(8)
         
+        p = QHBoxLayout()
+        p.setSpacing(8)
+        p.addWidget(QLabel("👤 Profile"))
+        self.profile = QComboBox()
+        self.profile.currentTextChanged.connect(self.switch_profile)
+        p.addWidget(self.profile, 1)
+        pb = QPushButton("New")
+        pb.setObjectName("sm")
+        pb.clicked.connect(self.new_profile)
+        p.addWidget(pb)
+        pb2 = QPushButton("Remove")
+        pb2.setObjectName("sm")
+        pb2.clicked.connect(self.remove_profile)
+        p.addWidget(pb2)
+        tl.addLayout(p)
+        
         s = QHBoxLayout()
         s.setSpacing(8)
         s.addWidget(QLabel("📂 Source"))
@@ -270,10 +457,14 @@ class App(QMainWindow):
         ll.setContentsMargins(0,0,0,0)
         ll.setSpacing(8)
         ll.addWidget(QLabel("📋 Available Backups"))
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("🔍 Filter by name, account, profile…")
+        self.search.textChanged.connect(self.apply_filter)
+        ll.addWidget(self.search)
         
         self.tbl = QTableWidget()
-        self.tbl.setColumnCount(4)
-        self.tbl.setHorizontalHeaderLabels(["Name", "Created", "Size", "Current"])
+        self.tbl.setColumnCount(7)
+        self.tbl.setHorizontalHeaderLabels(["Name", "Account", "Last Active", "Expires", "Created", "Size", "Current"])
         self.tbl.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         self.tbl.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
         self.tbl.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
@@ -333,36 +524,250 @@ class App(QMainWindow):
         logl.addWidget(self.log_text)
         
         layout.addWidget(log_w)
+        self.reload_profiles()
+    
+    def reload_profiles(self):
+        self.profile.blockSignals(True)
+        self.profile.clear()
+        self.profile.addItems(config.list_profiles())
+        self.profile.setCurrentText(config.get_active_profile())
+        self.profile.blockSignals(False)
+    
+    def switch_profile(self, name):
+        if not name or name == config.get_active_profile():
+            return
+        config.set_active_profile(name)
+        self.src.setText(config.get_source_dir())
+        self.claude.setText(config.get_claude_path())
+        self.log(f"Profile: {name}")
+        self.load_backups()
+    
+    def new_profile(self):
+        n, ok = QInputDialog.getText(self, "New Profile", "Profile name:")
+        n = n.strip()
+        if not ok or not n:
+            return
+        if not n.replace("-","").replace("_","").isalnum():
+            QMessageBox.warning(self, "Invalid", "Letters, numbers, - _ only")
+            return
+        try:
+            config.add_profile(n)
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid", str(e))
+            return
+        self.log(f"✓ Profile created: {n}")
+        self.reload_profiles()
+        self.profile.setCurrentText(n)
+    
+    def remove_profile(self):
+        n = config.get_active_profile()
+        if QMessageBox.question(self, "Remove Profile", f"Remove profile '{n}'?\n\nBackups are kept.") != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            config.remove_profile(n)
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        self.log(f"✓ Profile removed: {n}")
+        self.reload_profiles()
+        self.src.setText(config.get_source_dir())
+        self.claude.setText(config.get_claude_path())
+        self.load_backups()
     
     def log(self, msg):
         self.log_text.append(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
     
     def load_backups(self):
+        # Listing can hit the network (S3 index), so it runs off the GUI thread
+        if getattr(self, "listing", False):
+            self.reload_pending = True
+            return
+        if getattr(self, "list_worker", None):
+            self.list_worker.wait()  # already emitted, only returning from run()
+        self.listing, self.reload_pending = True, False
         self.log("Loading...")
+        self.list_worker = Worker(collect_backups)
+        self.list_worker.finished.connect(self.show_backups)
+        self.list_worker.error.connect(self.on_list_err)
+        self.list_worker.start()
+    
+    def on_list_err(self, e):
+        self.log(f"✗ {e}")
+        self.on_list_done()
+    
+    def on_list_done(self):
+        self.listing = False
+        if self.reload_pending:
+            self.load_backups()
+    
+    def show_backups(self, listing):
+        bs, cur, hot = listing
         self.tbl.setRowCount(0)
         try:
-            bs = list_backups()
-            cur = None
-            try:
-                cur = config.get_current_backup()
-            except Exception:
-                cur = None
             self.tbl.setRowCount(len(bs))
+            now = datetime.now().isoformat(timespec="seconds")
+            missing = False
             for i, b in enumerate(bs):
+                meta = b["meta"]
+                missing = missing or not meta
                 self.tbl.setItem(i, 0, QTableWidgetItem(b["name"]))
+                a = QTableWidgetItem(meta.get("account") or "")
+                tip = [f"Profile: {meta['profile']}"] if meta.get("profile") else []
+                if meta.get("account_id") and meta["account_id"] != meta.get("account"):
+                    tip.append(f"Account ID: {meta['account_id']}")
+                if tip:
+                    a.setToolTip("\n".join(tip))
+                self.tbl.setItem(i, 1, a)
+                la = QTableWidgetItem(get_time_str(meta.get("last_active")))
+                la.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+                self.tbl.setItem(i, 2, la)
+                exp = meta.get("expires")
+                e = QTableWidgetItem(get_time_str(exp) + (" (expired)" if exp and exp < now else ""))
+                e.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+                self.tbl.setItem(i, 3, e)
                 d = QTableWidgetItem(b["created"].strftime("%Y-%m-%d %H:%M"))
                 d.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.tbl.setItem(i, 1, d)
+                self.tbl.setItem(i, 4, d)
                 s = QTableWidgetItem(get_size_str(b["size"]))
                 s.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.tbl.setItem(i, 2, s)
-                ctext = "Current" if cur and b["name"] == cur else ""
+                self.tbl.setItem(i, 5, s)
+                ctext = "Current" if cur and b["name"] == cur else ("⚡ Staged" if b["name"] in hot else "")
                 c = QTableWidgetItem(ctext)
                 c.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.tbl.setItem(i, 3, c)
+                self.tbl.setItem(i, 6, c)
+                self.tbl.item(i, 0).setData(Qt.ItemDataRole.UserRole, " ".join(
+                    [b["name"], meta.get("account") or "", meta.get("account_id") or "", meta.get("profile") or "", ctext]).lower())
+            self.apply_filter()
             self.log(f"✓ {len(bs)} backup(s)")
+            staging.refresh_async()
+            if missing:
+                self.fill_metadata()
         except Exception as e:
             self.log(f"✗ {e}")
+        finally:
+            self.on_list_done()
+    
+    def edit_io_limits(self):
+        cur = config.get_io_limit()
+        dlg = QDialog(self)
+        dlg.setWindowTitle("Background I/O Limits")
+        form = QFormLayout(dlg)
+        mb = QSpinBox(); mb.setRange(0, 10000); mb.setSuffix(" MB/s"); mb.setSpecialValueText("Unlimited"); mb.setValue(int(cur["mb_per_sec"]))
+        fs = QSpinBox(); fs.setRange(0, 100000); fs.setSuffix(" files/s"); fs.setSpecialValueText("Unlimited"); fs.setValue(int(cur["files_per_sec"]))
+        lat = QSpinBox(); lat.setRange(0, 1000); lat.setSuffix(" ms"); lat.setSpecialValueText("Off"); lat.setValue(int(cur["backoff_latency_ms"]))
+        low = QCheckBox("Run background work at low CPU/I/O priority"); low.setChecked(bool(cur["low_priority"]))
+        form.addRow("Bandwidth", mb)
+        form.addRow("File rate", fs)
+        form.addRow("Back off above disk latency", lat)
+        form.addRow(low)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(dlg.accept)
+        buttons.rejected.connect(dlg.reject)
+        form.addRow(buttons)
+        if dlg.exec() != QDialog.DialogCode.Accepted:
+            return
+        config.set_io_limit({"mb_per_sec": mb.value(), "files_per_sec": fs.value(),
+                             "low_priority": low.isChecked(), "backoff_latency_ms": lat.value()})
+        throttle.reload()
+        self.log(f"✓ I/O limits: {mb.value() or '∞'} MB/s, {fs.value() or '∞'} files/s"
+                 + (", low priority" if low.isChecked() else "")
+                 + (f", back off above {lat.value()} ms" if lat.value() else ""))
+    
+    def enable_encryption(self):
+        current = None
+        if config.get_encryption().get("check"):
+            current, ok = QInputDialog.getText(self, "Enable Encryption", "Current passphrase:", QLineEdit.EchoMode.Password)
+            if not ok or not current:
+                return
+        p1, ok = QInputDialog.getText(self, "Enable Encryption", "New passphrase (or the current one to keep it):", QLineEdit.EchoMode.Password)
+        if not ok or not p1:
+            return
+        p2, ok = QInputDialog.getText(self, "Enable Encryption", "Repeat passphrase:", QLineEdit.EchoMode.Password)
+        if not ok:
+            return
+        if p1 != p2:
+            QMessageBox.warning(self, "Invalid", "Passphrases do not match")
+            return
+        try:
+            encryption.setup(p1, current)
+        except Exception as e:
+            self.on_err(str(e))
+            return
+        self.log("✓ Encryption enabled for new backups")
+    
+    def unlock_encryption(self):
+        p, ok = QInputDialog.getText(self, "Unlock Backups", "Passphrase:", QLineEdit.EchoMode.Password)
+        if not ok or not p:
+            self.log("⚠ Encrypted backups stay locked")
+            return
+        try:
+            if encryption.unlock(p):
+                self.log("✓ Backups unlocked")
+                self.load_backups()  # sealed account names can be shown now
+            else:
+                self.log("✗ Wrong passphrase")
+                QMessageBox.warning(self, "Error", "Wrong passphrase")
+        except Exception as e:
+            self.on_err(str(e))
+    
+    def disable_encryption(self):
+        enc = config.get_encryption()
+        if not enc.get("enabled"):
+            self.log("Encryption is already off")
+            return
+        if QMessageBox.question(self, "Disable Encryption", "New backups will be stored unencrypted. Existing encrypted backups still need the passphrase. Continue?") != QMessageBox.StandardButton.Yes:
+            return
+        enc["enabled"] = False
+        config.set_encryption(enc)
+        self.log("✓ Encryption disabled for new backups")
+    
+    def apply_filter(self):
+        text = self.search.text().strip().lower()
+        for i in range(self.tbl.rowCount()):
+            haystack = self.tbl.item(i, 0).data(Qt.ItemDataRole.UserRole) or ""
+            self.tbl.setRowHidden(i, bool(text) and not all(t in haystack for t in text.split()))
+    
+    def fill_metadata(self):
+        if getattr(self, "meta_worker", None) and self.meta_worker.isRunning():
+            return
+        self.meta_worker = Worker(metadata.fill_missing)
+        self.meta_worker.finished.connect(lambda n: n and self.load_backups())
+        self.meta_worker.error.connect(lambda e: self.log(f"✗ Metadata: {e}"))
+        self.meta_worker.start()
+    
+    def recover_operations(self):
+        try:
+            pending = journal.pending()
+        except Exception as e:
+            self.log(f"✗ Journal: {e}")
+            return
+        if not pending:
+            return
+        j = pending[0]
+        box = QMessageBox(self)
+        box.setWindowTitle("Interrupted Operation")
+        box.setText(f"An operation did not finish:\n\n{j.describe()}\n\nResume it, or roll it back?")
+        resume = box.addButton("Resume", QMessageBox.ButtonRole.AcceptRole)
+        rollback = box.addButton("Roll Back", QMessageBox.ButtonRole.DestructiveRole)
+        box.addButton("Later", QMessageBox.ButtonRole.RejectRole)
+        box.exec()
+        if box.clickedButton() is resume:
+            self.log(f"Resuming {j.op} '{j.name}'...")
+            self.worker = Worker(resume_operation, j)
+        elif box.clickedButton() is rollback:
+            self.log(f"Rolling back {j.op} '{j.name}'...")
+            self.worker = Worker(rollback_operation, j)
+        else:
+            self.log(f"⚠ {len(pending)} interrupted operation(s) left for later")
+            return
+        self.worker.finished.connect(self.on_recover_ok)
+        self.worker.error.connect(self.on_err)
+        self.worker.start()
+    
+    def on_recover_ok(self, name):
+        self.log(f"✓ Recovered: {name}")
+        self.load_backups()
+        self.recover_operations()
     
     def do_create(self):
         n = self.name.text().strip() or "claude"
@@ -381,20 +786,41 @@ class App(QMainWindow):
             if reply != QMessageBox.StandardButton.Yes:
                 self.log("✗ Backup cancelled (Claude running)")
                 return
+            close = True
             self.log("Closing Claude...")
-            count = terminate_claude()
-            if count > 0:
-                self.log(f"✓ Claude terminated ({count})")
-                time.sleep(0.5)
-            else:
-                self.log("⚠ No Claude process found")
+        else:
+            close = False
         
         self.log(f"Creating '{n}'...")
-        self.worker = Worker(create_backup, n)
-        self.worker.finished.connect(self.on_create_ok)
+        self.worker = Worker(after_closing_claude, close, create_backup, n)
+        self.worker.finished.connect(lambda r: (self.log_closed(r[0]), self.on_create_ok(r[1])))
+        self.worker.error.connect(self.on_err)
+        self.worker.start()
+    
+    def log_closed(self, count):
+        if count is None:
+            return
+        if count > 0:
+            self.log(f"✓ Claude terminated ({count})")
+        else:
+            self.log("⚠ No Claude process found")
+    
+    def do_snapshot_all(self):
+        profiles = config.list_profiles()
+        if is_claude_running():
+            if QMessageBox.question(self, "Claude is Running", "Claude is currently running. Snapshot anyway? Profiles with locked files will fail and be listed in the log.") != QMessageBox.StandardButton.Yes:
+                return
+        self.log(f"Snapshotting {len(profiles)} profile(s)...")
+        self.worker = Worker(snapshot_all_profiles)
+        self.worker.finished.connect(self.on_snapshot_all_ok)
         self.worker.error.connect(self.on_err)
         self.worker.start()
     
+    def on_snapshot_all_ok(self, results):
+        for profile, name, err in results:
+            self.log(f"✓ {profile}: {name}" if name else f"✗ {profile}: {err}")
+        self.load_backups()
+    
     def on_create_ok(self, name):
         self.log(f"✓ {name}")
         QMessageBox.information(self, "Success", f"Created:\n{name}")
@@ -418,30 +844,26 @@ class App(QMainWindow):
             if reply != QMessageBox.StandardButton.Yes:
                 self.log("✗ Restore cancelled (Claude running)")
                 return
+            close = True
             self.log("Closing Claude...")
-            count = terminate_claude()
-            if count > 0:
-                self.log(f"✓ Claude terminated ({count})")
-                time.sleep(0.5)
-            else:
-                self.log("⚠ No Claude process found")
         else:
             if QMessageBox.question(self, "Restore", f"Restore '{n}'? This will replace current data.") != QMessageBox.StandardButton.Yes:
                 return
+            close = False
         
         self.log(f"Restoring '{n}'...")
-        self.worker = Worker(restore_backup, n)
-        self.worker.finished.connect(lambda: self.on_restore_ok(n))
+        self.worker = Worker(after_closing_claude, close, restore_backup, n)
+        self.worker.finished.connect(lambda r: (self.log_closed(r[0]), self.on_restore_ok(n, r[1])))
         self.worker.error.connect(self.on_err)
         self.worker.start()
     
-    def on_restore_ok(self, n):
+    def on_restore_ok(self, n, fast=False):
         # mark current backup
         try:
             config.set_current_backup(n)
         except Exception:
             pass
-        self.log(f"✓ Restored: {n}")
+        self.log(f"✓ Restored: {n}" + (" (staged)" if fast else ""))
         self.load_backups()
         
         # Ask to restart Claude (no extra success popups)
@@ -455,6 +877,26 @@ class App(QMainWindow):
             self.log("Starting Claude...")
             start_claude()
     
+    def do_switch(self):
+        r = self.tbl.currentRow()
+        if r < 0:
+            QMessageBox.warning(self, "No Selection", "Select a backup")
+            return
+        n = self.tbl.item(r, 0).text()
+        if QMessageBox.question(self, "Switch", f"Switch to '{n}'? Claude will be restarted.") != QMessageBox.StandardButton.Yes:
+            return
+        self.log(f"Switching to '{n}'...")
+        self.worker = Worker(switch_to_backup, n)
+        self.worker.finished.connect(lambda t: self.on_switch_ok(n, t))
+        self.worker.error.connect(self.on_err)
+        self.worker.start()
+    
+    def on_switch_ok(self, n, timings):
+        phases = ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in timings.items() if k != "total")
+        self.log(f"✓ Switched to {n} in {timings['total'] * 1000:.0f} ms ({phases})")
+        self.load_backups()
+        self.update_status()
+    
     def do_delete(self):
         r = self.tbl.currentRow()
         if r < 0:
@@ -479,7 +921,14 @@ class App(QMainWindow):
         QMessageBox.critical(self, "Error", e)
     
     def update_status(self):
-        running = is_claude_running()
+        # Scan processes off the GUI thread; the result comes back as a signal
+        if self.status_future and not self.status_future.done():
+            return
+        self.status_future = iopool.submit(is_claude_running, fg=True)
+        self.status_future.add_done_callback(
+            lambda f: f.exception() is None and self.status_ready.emit(f.result()))
+    
+    def show_status(self, running):
         if running:
             self.status_label.setText("Claude is Running")
             self.stop_btn.setEnabled(True)
@@ -490,9 +939,11 @@ class App(QMainWindow):
     def stop_claude(self):
         if is_claude_running():
             self.log("Terminating Claude...")
-            count = terminate_claude()
-            self.log(f"✓ Terminated {count} process(es)")
-            self.update_status()
+            self.stop_btn.setEnabled(False)
+            self.stop_worker = Worker(terminate_claude)
+            self.stop_worker.finished.connect(lambda count: (self.log(f"✓ Terminated {count} process(es)"), self.update_status()))
+            self.stop_worker.error.connect(self.on_err)
+            self.stop_worker.start()
         else:
             self.log("No Claude process running")
     
@@ -535,12 +986,17 @@ class App(QMainWindow):
         r = self.tbl.currentRow()
         if r >= 0:
             n = self.tbl.item(r, 0).text()
-            subprocess.run(["explorer", str(Path(config.get_backup_dir()) / n)])
+            path = storage.get_backend().local_path(n)
+            if path is None:
+                self.log(f"⚠ {n} is stored remotely")
+                return
+            subprocess.run(["explorer", str(path)])
             self.log(f"Opened: {n}")
     
     def ctx_menu(self, pos):
         if self.tbl.itemAt(pos):
             m = QMenu(self)
+            m.addAction("⚡ Switch (restart Claude)", self.do_switch)
             m.addAction("🔄 Restore", self.do_restore)
             m.addAction("📂 Open", self.open_sel)
             m.addSeparator()
@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import config, throttle
+except:
+    import config, throttle
+
+# One bounded pool shared by every bulk/background operation so that
+# concurrent jobs never oversubscribe the disk. Foreground work (the user
+# is waiting on it) gets its own lane so it never queues behind
+# rate-limited background tasks.
+_pools = {}
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool(fg=False):
+    """Return the shared I/O pool (or the foreground lane), creating it on first use"""
+    with _pool_lock:
+        if fg not in _pools:
+            _pools[fg] = ThreadPoolExecutor(max_workers=config.get_io_workers(),
+                                            thread_name_prefix="io-fg" if fg else "io")
+        return _pools[fg]
+
+
+def in_pool():
+    """True when called from one of the shared pool's worker threads"""
+    return getattr(_local, "active", False)
+
+
+def _run_marked(fg, func, *args):
+    _local.active = True
+    try:
+        return throttle.run_as(fg, func, *args)
+    finally:
+        _local.active = False
+
+
+def submit(func, *args, fg=None):
+    """Submit a task to the shared pool, returns a Future.
+    Tasks inherit the caller's foreground flag (see throttle) unless `fg`
+    is given; follow-up work queued by a foreground operation should pass
+    fg=False so it does not escape the background budget. Foreground tasks
+    run on the foreground lane.
+    """
+    if fg is None:
+        fg = throttle.is_foreground()
+    return get_pool(fg).submit(_run_marked, fg, func, *args)
+
+
+def run_all(func, items):
+    """Run func(item) for every item on the shared pool.
+    Returns a list of (item, result, error) in input order.
+    Calls made from inside a pool worker run inline so nested bulk
+    operations cannot deadlock the bounded pool.
+    """
+    items = list(items)
+    results = []
+    if in_pool():
+        for item in items:
+            try:
+                results.append((item, func(item), None))
+            except Exception as e:
+                results.append((item, None, e))
+        return results
+    futures = [submit(func, item) for item in items]
+    for item, fut in zip(items, futures):
+        try:
+            results.append((item, fut.result(), None))
+        except Exception as e:
+            results.append((item, None, e))
+    return results
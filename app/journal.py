@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    from . import config
+except:
+    import config
+
+# One JSON-lines file per long operation under <backup_dir>/.journal:
+# a header line describing the operation, then one line per completed file
+# ({"done": "<relative path>", "stamp": [size, mtime_ns]}) or phase change
+# ({"phase": "..."}). The stamp is the source file's at copy time, so a
+# resume can tell which files changed since.
+# A journal that still exists on start belongs to an interrupted operation.
+
+
+def journal_dir():
+    return Path(config.get_backup_dir()) / ".journal"
+
+
+class Journal:
+    def __init__(self, path, header, done=None, phase=None):
+        self.path = Path(path)
+        self.header = header
+        self.done = dict(done or {})
+        self.phase = phase
+        self._lock = threading.Lock()
+
+    @property
+    def op(self):
+        return self.header["op"]
+
+    @property
+    def name(self):
+        return self.header["name"]
+
+    @property
+    def profile(self):
+        return self.header.get("profile")
+
+    def _append(self, record, sync=False):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+
+    def mark(self, rel, stamp=None):
+        """Record a file as completely written (from a source with `stamp`)"""
+        self.done[rel] = stamp
+        record = {"done": rel}
+        if stamp is not None:
+            record["stamp"] = stamp
+        self._append(record)
+
+    def set_phase(self, phase):
+        self.phase = phase
+        self._append({"phase": phase}, sync=True)
+
+    def finish(self):
+        """The operation completed: forget it"""
+        self.path.unlink(missing_ok=True)
+
+    def describe(self):
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.header.get("started", 0)))
+        return f"{self.op} '{self.name}' (profile {self.profile}, started {started}, {len(self.done)} file(s) done)"
+
+
+def start(op, name, **info):
+    """Begin journaling a new operation"""
+    d = journal_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    header = {"op": op, "name": name, "started": time.time(), **info}
+    j = Journal(d / f"{op}-{uuid.uuid4().hex[:8]}.jsonl", header)
+    j._append(header, sync=True)
+    return j
+
+
+def load(path):
+    header, done, phase = None, {}, None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from the crash
+            if header is None:
+                header = record
+            elif "done" in record:
+                done[record["done"]] = record.get("stamp")
+            elif "phase" in record:
+                phase = record["phase"]
+    if header is None:
+        return None
+    return Journal(path, header, done, phase)
+
+
+def pending():
+    """Journals of operations that were interrupted, oldest first"""
+    d = journal_dir()
+    if not d.exists():
+        return []
+    journals = []
+    for p in d.glob("*.jsonl"):
+        try:
+            j = load(p)
+        except OSError:
+            continue
+        if j is None:
+            p.unlink(missing_ok=True)
+        else:
+            journals.append(j)
+    journals.sort(key=lambda j: j.header.get("started", 0))
+    return journals
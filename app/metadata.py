@@ -0,0 +1,251 @@
+import base64
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+try:
+    from . import config, encryption, staging, storage
+except:
+    import config, encryption, staging, storage
+
+# Lightweight identity of a backup (which account, last activity, session
+# expiry), read once from the Network folder's Cookies database and cached
+# in <backup_dir>/.metadata.json so the list never opens backup contents.
+# For encrypted backups the identity fields are stored sealed with the
+# backup's key and only shown once it is unlocked.
+CACHE_FILE = ".metadata.json"
+HOSTS = ("claude.ai", "anthropic.com")
+SESSION_COOKIES = ("sessionKey",)
+ACCOUNT_COOKIES = ("lastActiveOrg", "ajs_user_id")  # opaque ids, the fallback
+IDENTITY = ("account", "account_id")
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+CHROME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+
+_cache_lock = threading.Lock()
+
+
+def _cache_path():
+    return Path(config.get_backup_dir()) / CACHE_FILE
+
+
+def load_cache():
+    try:
+        return json.loads(_cache_path().read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _save_cache(cache):
+    path = _cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def store(name, meta):
+    """Cache metadata for a backup (and publish it to a remote index)"""
+    with _cache_lock:
+        cache = load_cache()
+        cache[name] = meta
+        _save_cache(cache)
+    storage.get_backend().set_meta(name, meta)
+
+
+def forget(name):
+    with _cache_lock:
+        cache = load_cache()
+        if cache.pop(name, None) is not None:
+            _save_cache(cache)
+
+
+def attach(backups):
+    """Add a "meta" dict to each listed backup from the cache"""
+    cache = load_cache()
+    for b in backups:
+        meta = dict(cache.get(b["name"]) or b.get("meta") or {})
+        if meta.get("sealed"):
+            opened = encryption.open_text(meta["sealed"])
+            if opened:
+                meta.update(json.loads(opened))
+        b["meta"] = meta
+    return backups
+
+
+def _seal(meta, marker):
+    # Identity of an encrypted backup never lands in plaintext on disk or in
+    # a remote index: it is sealed with the backup's own key
+    if marker is None:
+        return meta
+    identity = {k: meta.pop(k, None) for k in IDENTITY}
+    if any(identity.values()):
+        meta["sealed"] = encryption.seal_text(json.dumps(identity), marker)
+    return meta
+
+
+# extraction
+
+def _chrome_time(value):
+    if not value:
+        return None
+    return (CHROME_EPOCH + timedelta(microseconds=value)).astimezone().replace(tzinfo=None).isoformat(timespec="seconds")
+
+
+def _dpapi_unprotect(data):
+    import ctypes
+    from ctypes import wintypes
+
+    class Blob(ctypes.Structure):
+        _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+    buf = ctypes.create_string_buffer(data, len(data))
+    blob_in = Blob(len(data), ctypes.cast(buf, ctypes.POINTER(ctypes.c_char)))
+    blob_out = Blob()
+    if not ctypes.windll.crypt32.CryptUnprotectData(ctypes.byref(blob_in), None, None, None, None, 0, ctypes.byref(blob_out)):
+        raise OSError("CryptUnprotectData failed")
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+
+def _cookie_decryptor(source_dir):
+    """Decrypt Chromium v10 cookie values with the app's Local State key.
+    Returns None when that is not possible (not Windows, no key, no cryptography).
+    """
+    if sys.platform != "win32":
+        return None
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        local_state = json.loads((Path(source_dir).parent / "Local State").read_text(encoding="utf-8"))
+        wrapped = base64.b64decode(local_state["os_crypt"]["encrypted_key"])
+        if not wrapped.startswith(b"DPAPI"):
+            return None
+        aes = AESGCM(_dpapi_unprotect(wrapped[5:]))
+    except Exception:
+        return None
+
+    def decrypt(blob):
+        if blob[:3] != b"v10":
+            return None
+        try:
+            return aes.decrypt(blob[3:15], blob[15:], None).decode("utf-8", "replace")
+        except Exception:
+            return None
+    return decrypt
+
+
+def _find_cookies(folder):
+    for rel in ("Cookies", "Network/Cookies"):
+        p = Path(folder) / rel
+        if p.is_file():
+            return p
+    return None
+
+
+def read_cookies_db(db_path, decrypt=None):
+    """Identity metadata from a Chromium Cookies database"""
+    uri = f"{Path(db_path).resolve().as_uri()}?mode=ro&immutable=1"
+    con = sqlite3.connect(uri, uri=True)
+    try:
+        where = " OR ".join("host_key = ? OR host_key LIKE ?" for _ in HOSTS)
+        rows = con.execute(
+            f"SELECT name, value, encrypted_value, expires_utc, last_access_utc FROM cookies WHERE {where}",
+            [p for h in HOSTS for p in (h, f"%.{h}")]).fetchall()
+    finally:
+        con.close()
+    meta = _empty()
+    if not rows:
+        return meta
+    values = {}
+    for name, value, encrypted_value, _, _ in rows:
+        if not value and encrypted_value and decrypt:
+            value = decrypt(bytes(encrypted_value))
+        if value:
+            values[name] = value
+    meta["account_id"] = next((values[n] for n in ACCOUNT_COOKIES if n in values), None)
+    meta["account"] = _readable_account(values) or meta["account_id"]
+    meta["last_active"] = _chrome_time(max(r[4] for r in rows))
+    session = [r[3] for r in rows if r[0] in SESSION_COOKIES]
+    meta["expires"] = _chrome_time(max(session or [r[3] for r in rows]))
+    return meta
+
+
+def _empty():
+    return {"account": None, "account_id": None, "last_active": None, "expires": None}
+
+
+def _readable_account(values):
+    """An email address from any cookie (e.g. analytics user traits)"""
+    from urllib.parse import unquote
+    for value in values.values():
+        match = EMAIL.search(unquote(value))
+        if match:
+            return match.group(0)
+    return None
+
+
+def extract(folder, key=None, decrypt=None):
+    """Identity metadata of a Network folder (decrypting it when `key` is set)"""
+    db = _find_cookies(folder)
+    if db is None:
+        return _empty()
+    if key is None:
+        return read_cookies_db(db, decrypt)
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = Path(tmp) / "Cookies"
+        encryption.decrypt_file(db, plain, key)
+        return read_cookies_db(plain, decrypt)
+
+
+def capture(name, source_dir, profile=None):
+    """Extract from the live source at backup time and cache it"""
+    try:
+        meta = extract(source_dir, decrypt=_cookie_decryptor(source_dir))
+    except Exception:
+        meta = _empty()
+    meta["profile"] = profile
+    try:
+        stored = _seal(dict(meta), encryption.write_marker()[0])
+    except Exception:
+        # Locked: the identity cannot be sealed, so it is not stored at all
+        stored = {k: v for k, v in meta.items() if k not in IDENTITY}
+    store(name, stored)
+    return meta
+
+
+def fill_missing():
+    """Background pass: extract metadata for backups that have none yet.
+    Remote backups are only read when a staged copy is on disk.
+    Returns the number of backups filled.
+    """
+    backend = storage.get_backend()
+    cache = load_cache()
+    decrypt = _cookie_decryptor(config.get_source_dir())
+    filled = 0
+    for b in backend.list():
+        if b["name"] in cache or b.get("meta"):
+            continue
+        folder = backend.local_path(b["name"])
+        if folder is None:
+            staged = staging.stage_root() / b["name"]
+            folder = staged if staged.is_dir() else None
+        if folder is None:
+            continue
+        try:
+            key = storage.folder_key(folder)
+            meta = extract(folder, key, decrypt)
+            marker_path = Path(folder) / encryption.MARKER
+            marker = encryption.read_marker(marker_path.read_bytes()) if key is not None else None
+        except Exception:
+            continue
+        meta["profile"] = None
+        store(b["name"], _seal(meta, marker))
+        filled += 1
+    return filled
@@ -0,0 +1,278 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    from . import config, iopool, storage, throttle
+except:
+    import config, iopool, storage, throttle
+
+# Ready-to-swap copies of hot backups live next to the source folder
+# (same volume) so switching to one is a pair of renames.
+INDEX_FILE = "stage.json"
+
+_locks = {}
+_locks_guard = threading.Lock()
+_refreshing = {}
+_pins = {}
+
+
+def stage_root(profile=None):
+    """Staging folder of a profile, beside its source_dir"""
+    source = Path(config.get_source_dir(profile))
+    return source.parent / f".{source.name}-staged"
+
+
+def _lock(root):
+    with _locks_guard:
+        return _locks.setdefault(str(root), threading.RLock())
+
+
+def _load(root):
+    try:
+        index = json.loads((root / INDEX_FILE).read_text(encoding="utf-8"))
+    except Exception:
+        index = {}
+    index.setdefault("history", {})
+    index.setdefault("staged", {})
+    return index
+
+
+def _save(root, index):
+    root.mkdir(exist_ok=True, parents=True)
+    tmp = root / (INDEX_FILE + ".tmp")
+    tmp.write_text(json.dumps(index, indent=2), encoding="utf-8")
+    os.replace(tmp, root / INDEX_FILE)
+
+
+def _signature(backup):
+    return f"{backup['created'].isoformat()}|{backup['size']}"
+
+
+def _remove(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _remove_paced(path):
+    # Background cleanup goes through the shared I/O budget
+    try:
+        throttle.rmtree(path)
+    except OSError:
+        _remove(path)
+
+
+def _retire(root, name):
+    # Renaming is instant, so under the lock copies are only moved aside;
+    # the paced delete of .old-* folders happens after the lock is released
+    path = root / name
+    if path.exists():
+        os.replace(path, root / f".old-{uuid.uuid4().hex[:8]}")
+
+
+def _sweep(root):
+    for p in root.glob(".old-*") if root.exists() else []:
+        _remove_paced(p)
+
+
+@contextmanager
+def pinned(name, profile=None):
+    """Keep refresh from evicting the staged copy of `name` inside the block"""
+    key = str(stage_root(profile))
+    with _locks_guard:
+        pins = _pins.setdefault(key, Counter())
+        pins[name] += 1
+    try:
+        yield
+    finally:
+        with _locks_guard:
+            pins[name] -= 1
+            if pins[name] <= 0:
+                del pins[name]
+
+
+def _is_pinned(root, name):
+    with _locks_guard:
+        return _pins.get(str(root), {}).get(name, 0) > 0
+
+
+def record_restore(name, profile=None):
+    """Count a restore of `name` so it is considered hot"""
+    root = stage_root(profile)
+    with _lock(root):
+        index = _load(root)
+        h = index["history"].setdefault(name, {"hits": 0})
+        h["hits"] += 1
+        h["last_used"] = time.time()
+        _save(root, index)
+
+
+def swap_in(name, profile=None):
+    """Replace the source folder with the staged copy of `name`.
+    Returns False (and changes nothing) when `name` is not staged.
+    """
+    root = stage_root(profile)
+    source = Path(config.get_source_dir(profile))
+    with _lock(root):
+        index = _load(root)
+        staged = root / name
+        if name not in index["staged"] or not staged.is_dir():
+            return False
+        old = None
+        if source.exists():
+            old = root / f".old-{int(time.time() * 1000)}"
+            os.replace(source, old)
+        try:
+            os.replace(staged, source)
+        except Exception:
+            if old is not None:
+                os.replace(old, source)
+            raise
+        del index["staged"][name]
+        _save(root, index)
+    if old is not None:
+        iopool.submit(_remove_paced, old, fg=False)
+    return True
+
+
+def forget(name, profile=None):
+    """Drop the staged copy and restore history of a deleted backup"""
+    root = stage_root(profile)
+    with _lock(root):
+        index = _load(root)
+        staged = index["staged"].pop(name, None)
+        history = index["history"].pop(name, None)
+        _retire(root, name)
+        if staged is not None or history is not None:
+            _save(root, index)
+    iopool.submit(_sweep, root, fg=False)
+
+
+def _hot(index, backups, limit):
+    """Backup names worth staging: most recently, then most frequently restored"""
+    available = {b["name"] for b in backups}
+    ranked = sorted(
+        (n for n in index["history"] if n in available),
+        key=lambda n: (index["history"][n].get("last_used", 0), index["history"][n]["hits"]),
+        reverse=True,
+    )
+    by_hits = sorted(ranked, key=lambda n: index["history"][n]["hits"], reverse=True)
+    hot = []
+    for n in ranked[:max(1, limit // 2)] + by_hits:
+        if n not in hot:
+            hot.append(n)
+    return hot[:limit]
+
+
+def refresh(profile=None):
+    """Refresh staging, coalescing calls that arrive while one is running"""
+    key = str(stage_root(profile))
+    with _locks_guard:
+        if key in _refreshing:
+            _refreshing[key] = True
+            return []
+        _refreshing[key] = False
+    staged = []
+    try:
+        while True:
+            staged += _refresh(profile)
+            with _locks_guard:
+                if not _refreshing[key]:
+                    return staged
+                _refreshing[key] = False
+    finally:
+        with _locks_guard:
+            _refreshing.pop(key, None)
+
+
+def _refresh(profile):
+    """Bring the staging area in line with the hot set and the disk budget.
+    Stale copies (backup changed or deleted) are dropped, missing hot
+    backups are staged, least recently used copies are evicted.
+    """
+    root = stage_root(profile)
+    backend = storage.get_backend()
+    backups = {b["name"]: b for b in backend.list()}
+    budget = config.get_stage_budget_mb() * 1024 * 1024
+    with _lock(root):
+        index = _load(root)
+        for n, entry in list(index["staged"].items()):
+            if n not in backups or entry["signature"] != _signature(backups[n]):
+                del index["staged"][n]
+                _retire(root, n)
+        for n in list(index["history"]):
+            if n not in backups:
+                del index["history"][n]
+        hot = _hot(index, backups.values(), config.get_stage_count())
+        # Evict copies that fell out of the hot set or over the budget
+        used = 0
+        keep = []
+        for n in hot:
+            size = backups[n]["size"]
+            if used + size <= budget:
+                used += size
+                keep.append(n)
+        for n in list(index["staged"]):
+            if n not in keep and not _is_pinned(root, n):
+                del index["staged"][n]
+                _retire(root, n)
+        _save(root, index)
+        todo = [n for n in keep if n not in index["staged"]]
+    _sweep(root)
+    for p in root.glob(".*.tmp") if root.exists() else []:
+        if time.time() - p.stat().st_mtime > 3600:
+            _remove_paced(p)  # left behind by a crash
+    for n in todo:
+        _stage_one(root, backend, backups[n])
+    return todo
+
+
+def _stage_one(root, backend, backup):
+    n = backup["name"]
+    tmp = root / f".{n}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        backend.get(n, tmp)
+    except Exception:
+        _remove(tmp)
+        raise
+    with _lock(root):
+        index = _load(root)
+        _retire(root, n)
+        os.replace(tmp, root / n)
+        index["staged"][n] = {"signature": _signature(backup), "size": backup["size"]}
+        _save(root, index)
+    iopool.submit(_sweep, root, fg=False)
+
+
+def stage(name, profile=None):
+    """Make sure `name` has an up-to-date staged copy right now.
+    Returns True if one was already there.
+    """
+    root = stage_root(profile)
+    backend = storage.get_backend()
+    backup = backend.info(name)
+    if backup is None:
+        raise FileNotFoundError(f"Backup not found")
+    with _lock(root):
+        entry = _load(root)["staged"].get(name)
+        if entry and entry["signature"] == _signature(backup) and (root / name).is_dir():
+            return True
+    _stage_one(root, backend, backup)
+    return False
+
+
+def refresh_async(profile=None):
+    """Refresh staging on the shared I/O pool, always as background work"""
+    return iopool.submit(refresh, profile or config.get_active_profile(), fg=False)
+
+
+def staged_names(profile=None):
+    """Names of backups with a ready staged copy"""
+    root = stage_root(profile)
+    with _lock(root):
+        return [n for n in _load(root)["staged"] if (root / n).is_dir()]
@@ -0,0 +1,573 @@
+import io
+import json
+import os
+import random
+import shutil
+import tarfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from . import config, encryption, iopool, throttle
+except:
+    import config, encryption, iopool, throttle
+
+INDEX_KEY = "index.json"
+INDEX_RETRIES = 10
+MIN_CHUNK = 5 * 1024 * 1024  # S3 minimum multipart part size
+
+
+class _Head:
+    """Read at most n bytes of a binary stream"""
+
+    def __init__(self, f, n):
+        self.f = f
+        self.n = n
+
+    def read(self, size=-1):
+        size = self.n if size < 0 else min(size, self.n)
+        data = self.f.read(size)
+        self.n -= len(data)
+        return data
+
+
+class _Paced:
+    """Binary reader that charges what it reads to the background budget"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        throttle.consume(len(data))
+        return data
+
+
+def copy_tree(src, dst, copy_file=throttle.copy_file, skip=(), journal=None):
+    """Copy a directory tree, one file per task on the shared I/O pool.
+    `skip` holds paths (relative to src, "/"-separated) that are not copied.
+    With a journal, every finished file is recorded with the size and
+    mtime it had, and files it already lists are skipped unless the source
+    changed since, so an interrupted copy of a live folder can resume.
+    """
+    src, dst = Path(src), Path(dst)
+    done = journal.done if journal else {}
+    files = []
+    for root, dirs, names in os.walk(src):
+        rel = Path(root).relative_to(src)
+        (dst / rel).mkdir(parents=True, exist_ok=True)
+        files += [(rel / n).as_posix() for n in names]
+    for f in set(done).difference(files):
+        (dst / f).unlink(missing_ok=True)  # gone from the source since
+    files = [f for f in files if f not in skip and (f not in done or done[f] != _stamp(src / f))]
+
+    def copy(f):
+        stamp = _stamp(src / f)
+        copy_file(src / f, dst / f)
+        if journal:
+            journal.mark(f, stamp)
+
+    errors = [(f, e) for f, _, e in iopool.run_all(copy, files) if e]
+    if errors:
+        f, e = errors[0]
+        raise RuntimeError(f"Failed to copy {f}: {e}")
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def folder_key(path):
+    """Key of an encrypted backup folder, None if it is not encrypted"""
+    marker = Path(path) / encryption.MARKER
+    if not marker.exists():
+        return None
+    return encryption.key_for(encryption.read_marker(marker.read_bytes()))
+
+
+def _encrypt_copy(key):
+    return lambda s, d: encryption.encrypt_file(s, d, key)
+
+
+def _decrypt_copy(key):
+    return lambda s, d: encryption.decrypt_file(s, d, key)
+
+
+class StorageBackend:
+    """Where backups live. Backups are addressed by their folder name (backup-*)."""
+
+    def put(self, name, src_dir, journal=None):
+        """Store the directory src_dir as backup `name`.
+        The backup must not show up in list() until it is complete; calling
+        again with the same journal resumes an interrupted put.
+        """
+        raise NotImplementedError
+
+    def get(self, name, dest_dir, journal=None):
+        """Materialize backup `name` into dest_dir (resumable with a journal)"""
+        raise NotImplementedError
+
+    def discard_partial(self, name):
+        """Drop what an interrupted put() left behind"""
+
+    def list(self):
+        """Return [{"name", "created", "size"}] newest first"""
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def exists(self, name):
+        return self.info(name) is not None
+
+    def info(self, name):
+        """The list() entry of one backup, or None"""
+        return next((b for b in self.list() if b["name"] == name), None)
+
+    def local_path(self, name):
+        """Path of a backup on this machine, or None for remote backends"""
+        return None
+
+    def set_meta(self, name, meta):
+        """Publish identity metadata where other machines can list it"""
+
+
+class LocalBackend(StorageBackend):
+    """Backups are plain directories under backup_dir."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _partial(self, name):
+        # Not prefixed "backup-", so list() ignores it until it is renamed
+        return self.root / f".partial-{name}"
+
+    def put(self, name, src_dir, journal=None):
+        partial = self._partial(name)
+        if journal is not None and not partial.is_dir() and (self.root / name).is_dir():
+            return  # interrupted after the final rename: already complete
+        if journal is not None and partial.is_dir():
+            key = folder_key(partial)
+            if key is None and config.get_encryption().get("enabled"):
+                # Never finish an encrypted-mode backup in plaintext
+                raise RuntimeError("Interrupted backup is not encrypted: roll it back and create it again")
+        else:
+            # Raises while encryption is locked, before anything is written
+            marker, key = encryption.write_marker()
+            partial.mkdir(parents=True)
+            if key is not None:
+                (partial / encryption.MARKER).write_bytes(encryption.marker_bytes(marker))
+        copy_tree(src_dir, partial, _encrypt_copy(key) if key else throttle.copy_file, journal=journal)
+        os.replace(partial, self.root / name)
+
+    def discard_partial(self, name):
+        shutil.rmtree(self._partial(name), ignore_errors=True)
+
+    def get(self, name, dest_dir, journal=None):
+        src = self.root / name
+        key = folder_key(src)
+        if key is not None:
+            copy_tree(src, dest_dir, _decrypt_copy(key), skip={encryption.MARKER}, journal=journal)
+        else:
+            copy_tree(src, dest_dir, journal=journal)
+
+    def _entry(self, item):
+        return {
+            "name": item.name,
+            "created": datetime.fromtimestamp(item.stat().st_ctime),
+            "size": sum(f.stat().st_size for f in item.rglob('*') if f.is_file())
+        }
+
+    def list(self):
+        if not self.root.exists():
+            return []
+        backups = []
+        for item in self.root.iterdir():
+            if item.is_dir() and item.name.startswith("backup-"):
+                try:
+                    backups.append(self._entry(item))
+                except:
+                    pass
+        backups.sort(key=lambda x: x["created"], reverse=True)
+        return backups
+
+    def info(self, name):
+        item = self.root / name
+        if not item.is_dir():
+            return None
+        return self._entry(item)
+
+    def delete(self, name):
+        path = self.root / name
+        if not path.exists():
+            raise FileNotFoundError(f"Backup not found")
+        for i in range(3):
+            try:
+                throttle.rmtree(path)
+                return
+            except:
+                time.sleep(0.3)
+        raise RuntimeError("Cannot delete")
+
+    def exists(self, name):
+        return (self.root / name).is_dir()
+
+    def local_path(self, name):
+        return self.root / name
+
+
+class S3Backend(StorageBackend):
+    """Backups are tar archives in an S3-compatible bucket.
+
+    Each backup is one object `<prefix><name>.tar`, transferred as parallel
+    multipart chunks on the shared I/O pool. Transfer state is kept under
+    `<backup_dir>/.transfers` so an interrupted upload or download resumes
+    with only the missing chunks. Unlike local storage this stages the
+    whole tar on disk: resuming by part needs a fixed file to re-read the
+    same part boundaries from. `<prefix>index.json` lists all backups so
+    listing never enumerates the bucket.
+    """
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, chunk_size_mb=8, staging_dir=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("S3 storage requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.chunk_size = max(MIN_CHUNK, int(chunk_size_mb * 1024 * 1024))
+        self.staging = Path(staging_dir or Path(config.get_backup_dir()) / ".transfers")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+        )
+        self._index_lock = threading.Lock()
+        self._transfer_locks = {}
+        self._transfer_guard = threading.Lock()
+
+    def _key(self, name):
+        return f"{self.prefix}{name}.tar"
+
+    def _transfer_lock(self, name):
+        # Transfers of one backup share their files under .transfers, so a
+        # staging refresh and a restore fetching the same backup take turns
+        with self._transfer_guard:
+            return self._transfer_locks.setdefault(name, threading.Lock())
+
+    # index
+
+    def _fetch_index(self):
+        """(index, ETag), ETag None when there is no index yet"""
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.prefix + INDEX_KEY)
+        except self.client.exceptions.NoSuchKey:
+            return {}, None
+        return json.loads(obj["Body"].read().decode("utf-8")), obj["ETag"]
+
+    def _read_index(self):
+        return self._fetch_index()[0]
+
+    def _write_index(self, index, etag):
+        """Replace the index only if it is still the version `etag`.
+        Returns False when another writer changed it first.
+        """
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self.prefix + INDEX_KEY,
+                Body=json.dumps(index, indent=2).encode("utf-8"),
+                ContentType="application/json",
+                **condition,
+            )
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+    def _modify_index(self, change):
+        # Other machines write the same index: read-modify-write with a
+        # conditional put, and start over from a fresh read on conflict
+        with self._index_lock:
+            for attempt in range(INDEX_RETRIES):
+                index, etag = self._fetch_index()
+                if not change(index):
+                    return
+                if self._write_index(index, etag):
+                    return
+                time.sleep(random.uniform(0.05, 0.2) * (attempt + 1))
+        raise RuntimeError("Backup index is busy, try again")
+
+    def _update_index(self, name, entry):
+        def change(index):
+            if entry is None:
+                return index.pop(name, None) is not None
+            index[name] = entry
+            return True
+        self._modify_index(change)
+
+    def list(self):
+        backups = []
+        for name, entry in self._read_index().items():
+            backups.append({
+                "name": name,
+                "created": datetime.fromisoformat(entry["created"]),
+                "size": entry.get("size", 0),
+                "meta": entry.get("meta")
+            })
+        backups.sort(key=lambda x: x["created"], reverse=True)
+        return backups
+
+    def exists(self, name):
+        return name in self._read_index()
+
+    def set_meta(self, name, meta):
+        def change(index):
+            if name not in index:
+                return False
+            index[name]["meta"] = meta
+            return True
+        self._modify_index(change)
+
+    # transfers
+
+    def _state(self, path):
+        if path.exists():
+            try:
+                return json.loads(path.read_text(encoding="utf-8"))
+            except Exception:
+                pass
+        return None
+
+    def _save_state(self, path, state):
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _ranges(self, size):
+        count = max(1, -(-size // self.chunk_size))
+        return [(i + 1, i * self.chunk_size, min(self.chunk_size, size - i * self.chunk_size)) for i in range(count)]
+
+    def put(self, name, src_dir, journal=None):
+        with self._transfer_lock(name):
+            self._put(name, src_dir)
+
+    def _put(self, name, src_dir):
+        # The upload state file doubles as the journal: parts already
+        # uploaded are skipped on retry, and the index only changes at the end
+        self.staging.mkdir(exist_ok=True, parents=True)
+        archive = self.staging / f"{name}.tar"
+        state_path = self.staging / f"{name}.upload.json"
+        state = self._state(state_path)
+        if state is None or not archive.exists():
+            marker, key = encryption.write_marker()
+            # Built on the calling thread, so it opts into background mode
+            with throttle.background(), tarfile.open(archive, "w") as tar:
+                self._add_tree(tar, Path(src_dir), marker, key)
+            state = None
+        self._upload(name, archive, state_path, state)
+        size = sum(f.stat().st_size for f in Path(src_dir).rglob('*') if f.is_file())
+        self._update_index(name, {"created": datetime.now().isoformat(timespec="seconds"), "size": size})
+        archive.unlink()
+        state_path.unlink(missing_ok=True)
+
+    def _add_tree(self, tar, src_dir, marker, key):
+        # Every file is read through the background budget
+        if key is not None:
+            # The marker goes first so readers know how to open the rest
+            data = encryption.marker_bytes(marker)
+            info = tarfile.TarInfo(f"./{encryption.MARKER}")
+            info.size = len(data)
+            info.mtime = time.time()
+            tar.addfile(info, io.BytesIO(data))
+        for root, dirs, names in os.walk(src_dir):
+            rel = Path(root).relative_to(src_dir)
+            tar.add(root, arcname=f"./{rel.as_posix()}", recursive=False)
+            for n in names:
+                path = Path(root) / n
+                info = tar.gettarinfo(path, arcname=f"./{(rel / n).as_posix()}")
+                if not info.isfile():
+                    continue
+                throttle.consume(nfiles=1)
+                with open(path, "rb") as f:
+                    if key is None:
+                        tar.addfile(info, _Paced(f))
+                        continue
+                    plain = info.size
+                    info.size = encryption.encrypted_size(plain)
+                    tar.addfile(info, encryption.StreamReader(encryption.encrypt_stream(_Head(_Paced(f), plain), key)))
+
+    def discard_partial(self, name):
+        state_path = self.staging / f"{name}.upload.json"
+        state = self._state(state_path)
+        if state and state.get("upload_id"):
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(name), UploadId=state["upload_id"])
+            except Exception:
+                pass
+        (self.staging / f"{name}.tar").unlink(missing_ok=True)
+        state_path.unlink(missing_ok=True)
+
+    def _extract(self, archive, dest_dir, journal=None):
+        dest_dir = Path(dest_dir)
+        dest_dir.mkdir(parents=True, exist_ok=journal is not None)
+        done = journal.done if journal else ()
+        with tarfile.open(archive) as tar:
+            members = tar.getmembers()
+            marker = next((m for m in members if os.path.normpath(m.name) == encryption.MARKER), None)
+            key = None
+            if marker is not None:
+                key = encryption.key_for(encryption.read_marker(tar.extractfile(marker).read()))
+        files = []
+        for m in members:
+            rel = os.path.normpath(m.name)
+            if m is marker or rel == "." or os.path.isabs(rel) or rel.split(os.sep)[0] == "..":
+                continue
+            if m.isdir():
+                (dest_dir / rel).mkdir(parents=True, exist_ok=True)
+            elif m.isfile() and Path(rel).as_posix() not in done:
+                files.append((Path(rel).as_posix(), m))
+
+        # Members are read straight from their offsets, so files decrypt
+        # and land on disk in parallel
+        def restore(item):
+            rel, m = item
+            target = dest_dir / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            throttle.consume(nfiles=1)
+            with open(archive, "rb") as f, open(target, "wb") as out:
+                f.seek(m.offset_data)
+                head = _Head(f, m.size)
+                if key is None:
+                    blocks = iter(lambda: head.read(throttle.BLOCK_SIZE), b"")
+                else:
+                    blocks = encryption.decrypt_stream(head, key)
+                for block in blocks:
+                    throttle.consume(len(block))
+                    out.write(block)
+                out.flush()
+                os.fsync(out.fileno())
+            if journal:
+                journal.mark(rel)
+
+        errors = [e for _, _, e in iopool.run_all(restore, files) if e]
+        if errors:
+            raise errors[0]
+
+    def _upload(self, name, archive, state_path, state):
+        key = self._key(name)
+        size = archive.stat().st_size
+        if size <= self.chunk_size:
+            with open(archive, "rb") as f:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=f)
+            return
+        if state is None:
+            upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+            state = {"upload_id": upload_id, "chunk_size": self.chunk_size, "parts": {}}
+            self._save_state(state_path, state)
+        ranges = self._ranges(size) if state["chunk_size"] == self.chunk_size else None
+        if ranges is None:
+            # chunk size changed since the interrupted attempt: start over
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=state["upload_id"])
+            return self._upload(name, archive, state_path, None)
+        lock = threading.Lock()
+
+        def send(part):
+            number, offset, length = part
+            throttle.consume(length)
+            with open(archive, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            etag = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=state["upload_id"],
+                PartNumber=number, Body=data)["ETag"]
+            with lock:
+                state["parts"][str(number)] = etag
+                self._save_state(state_path, state)
+
+        todo = [p for p in ranges if str(p[0]) not in state["parts"]]
+        errors = [e for _, _, e in iopool.run_all(send, todo) if e]
+        if errors:
+            raise RuntimeError(f"Upload interrupted, retry to resume: {errors[0]}")
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=state["upload_id"],
+            MultipartUpload={"Parts": [{"PartNumber": n, "ETag": state["parts"][str(n)]} for n, _, _ in ranges]})
+
+    def get(self, name, dest_dir, journal=None):
+        with self._transfer_lock(name):
+            self._get(name, dest_dir, journal)
+
+    def _get(self, name, dest_dir, journal=None):
+        self.staging.mkdir(exist_ok=True, parents=True)
+        key = self._key(name)
+        archive = self.staging / f"{name}.download.tar"
+        state_path = self.staging / f"{name}.download.json"
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        size = head["ContentLength"]
+        state = self._state(state_path)
+        if state is None or state.get("etag") != head["ETag"] or state.get("chunk_size") != self.chunk_size or not archive.exists():
+            state = {"etag": head["ETag"], "chunk_size": self.chunk_size, "done": []}
+            with open(archive, "wb") as f:
+                f.truncate(size)
+            self._save_state(state_path, state)
+        lock = threading.Lock()
+
+        def fetch(part):
+            number, offset, length = part
+            throttle.consume(length)
+            body = self.client.get_object(
+                Bucket=self.bucket, Key=key, IfMatch=head["ETag"],
+                Range=f"bytes={offset}-{offset + length - 1}")["Body"].read()
+            with open(archive, "r+b") as f:
+                f.seek(offset)
+                f.write(body)
+            with lock:
+                state["done"].append(number)
+                self._save_state(state_path, state)
+
+        todo = [p for p in self._ranges(size) if p[0] not in state["done"]] if size else []
+        errors = [e for _, _, e in iopool.run_all(fetch, todo) if e]
+        if errors:
+            raise RuntimeError(f"Download interrupted, retry to resume: {errors[0]}")
+        self._extract(archive, dest_dir, journal)
+        archive.unlink()
+        state_path.unlink(missing_ok=True)
+
+    def delete(self, name):
+        if not self.exists(name):
+            raise FileNotFoundError(f"Backup not found")
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+        self._update_index(name, None)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the storage backend configured in config.json (cached)"""
+    storage = config.get_storage()
+    backup_dir = config.get_backup_dir()
+    cache_key = json.dumps([storage, backup_dir], sort_keys=True)
+    with _backends_lock:
+        backend = _backends.get(cache_key)
+        if backend is None:
+            kind = storage.get("type", "local")
+            if kind == "local":
+                backend = LocalBackend(backup_dir)
+            elif kind == "s3":
+                opts = {k: v for k, v in storage.items() if k != "type"}
+                backend = S3Backend(staging_dir=Path(backup_dir) / ".transfers", **opts)
+            else:
+                raise ValueError(f"Unknown storage type: {kind}")
+            _backends.clear()
+            _backends[cache_key] = backend
+        return backend
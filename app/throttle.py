@@ -0,0 +1,289 @@
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from . import config
+except:
+    import config
+
+# One I/O budget (MB/s and files/s token buckets) shared by every
+# background operation in the app, plus optional low OS priority and a
+# backoff that slows everything down while disk latency is high.
+BLOCK_SIZE = 1024 * 1024
+SAMPLE_INTERVAL = 0.5
+MEASURE_WINDOW = (1.0, 5.0)  # seconds; longer gaps are idle time, not throughput
+
+
+class TokenBucket:
+    """Blocking token bucket; rate 0 means unlimited.
+    An unlimited bucket measures the throughput it sees, so a backoff
+    factor below 1 still has a rate to scale down.
+    """
+
+    def __init__(self, rate=0, burst=None):
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst=None):
+        with self._lock:
+            self.rate = float(rate or 0)
+            self.burst = float(burst or self.rate)
+            self.tokens = self.burst
+            self.stamp = time.monotonic()
+            self.measured = 0.0
+            self._window = (self.stamp, 0.0)
+
+    def _measure(self, amount, now):
+        start, total = self._window
+        total += amount
+        if now - start < MEASURE_WINDOW[0]:
+            self._window = (start, total)
+            return
+        if now - start <= MEASURE_WINDOW[1]:
+            observed = total / (now - start)
+            self.measured = observed if not self.measured else (self.measured + observed) / 2
+        self._window = (now, 0.0)
+
+    def consume(self, amount, factor=1.0):
+        """Take `amount` tokens, sleeping until the bucket can pay for them.
+        Requests larger than the burst go into debt instead of waiting forever.
+        """
+        if amount <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate
+            if rate <= 0:
+                if factor >= 1.0 or not self.measured:
+                    if factor >= 1.0:
+                        self._measure(amount, now)
+                    return
+                rate = self.measured  # backing off without a limit
+            rate *= factor
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * rate)
+            self.stamp = now
+            self.tokens -= amount
+            wait = -self.tokens / rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+_bytes = TokenBucket()
+_files = TokenBucket()
+_settings = None
+_settings_lock = threading.Lock()
+_local = threading.local()
+_factor = 1.0
+_monitor = None
+
+
+def reload():
+    """Re-read limits from config.json"""
+    global _settings
+    with _settings_lock:
+        _settings = config.get_io_limit()
+        _bytes.configure(_settings.get("mb_per_sec", 0) * 1024 * 1024)
+        _files.configure(_settings.get("files_per_sec", 0))
+    if _settings.get("backoff_latency_ms"):
+        _start_monitor()
+    return _settings
+
+
+def settings():
+    return _settings if _settings is not None else reload()
+
+
+# foreground work (the user is waiting with Claude stopped) is exempt
+
+def is_foreground():
+    return getattr(_local, "foreground", False)
+
+
+@contextmanager
+def foreground():
+    prev = is_foreground()
+    _local.foreground = True
+    try:
+        yield
+    finally:
+        _local.foreground = prev
+
+
+def consume(nbytes=0, nfiles=0):
+    """Charge background I/O against the shared budget"""
+    if is_foreground():
+        return
+    settings()
+    if nfiles:
+        _files.consume(nfiles, _factor)
+    if nbytes:
+        _bytes.consume(nbytes, _factor)
+
+
+# throttled primitives
+
+def copy_file(src, dst):
+    """shutil.copy2 that streams in blocks through the byte budget and
+    fsyncs the copy
+    """
+    consume(nfiles=1)
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        while True:
+            block = fin.read(BLOCK_SIZE)
+            if not block:
+                break
+            consume(len(block))
+            fout.write(block)
+        # on disk before a journal can record the file as done
+        fout.flush()
+        os.fsync(fout.fileno())
+    shutil.copystat(src, dst)
+
+
+def rmtree(path):
+    """shutil.rmtree paced by the files/s budget"""
+    for root, dirs, names in os.walk(path, topdown=False):
+        for n in names:
+            consume(nfiles=1)
+            p = os.path.join(root, n)
+            try:
+                os.unlink(p)
+            except PermissionError:
+                os.chmod(p, 0o666)
+                os.unlink(p)
+        for n in dirs:
+            os.rmdir(os.path.join(root, n))
+    os.rmdir(path)
+
+
+# OS priority
+
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+THREAD_MODE_BACKGROUND_END = 0x00020000
+LOW_NICE = 10
+
+
+def _lower_thread():
+    """Lower the calling thread's nice value and I/O class (Linux).
+    Returns what _restore_thread needs, None if nothing was changed.
+    """
+    tid = threading.get_native_id()
+    try:
+        nice = os.getpriority(os.PRIO_PROCESS, tid)
+    except OSError:
+        return None
+    ionice = None
+    try:
+        import psutil
+        t = psutil.Process(tid)
+        ionice = t.ionice()
+        t.ionice(psutil.IOPRIO_CLASS_IDLE)
+    except Exception:
+        ionice = None
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, max(nice, LOW_NICE))
+    except OSError:
+        pass
+    return tid, nice, ionice
+
+
+def _restore_thread(saved):
+    tid, nice, ionice = saved
+    if ionice is not None:
+        try:
+            import psutil
+            psutil.Process(tid).ionice(ionice.ioclass, ionice.value or None)
+        except Exception:
+            pass
+    try:
+        os.setpriority(os.PRIO_PROCESS, tid, nice)
+    except OSError:
+        pass  # lowering nice needs CAP_SYS_NICE: this worker stays at low CPU priority
+
+
+@contextmanager
+def background():
+    """Run the block at low CPU/I/O priority when low_priority is enabled.
+    Only the calling thread is affected: THREAD_MODE_BACKGROUND on Windows,
+    per-thread nice and idle I/O class on Linux. Without privileges Linux
+    cannot raise nice again, so a worker that ran background work keeps a
+    low CPU priority (its I/O class is restored). Other platforms are not
+    lowered.
+    """
+    if is_foreground() or not settings().get("low_priority"):
+        yield
+        return
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        entered = kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        try:
+            yield
+        finally:
+            if entered:
+                kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_END)
+        return
+    saved = _lower_thread() if sys.platform.startswith("linux") else None
+    try:
+        yield
+    finally:
+        if saved is not None:
+            _restore_thread(saved)
+
+
+def run_as(fg, func, *args):
+    """Run func in a worker thread on behalf of a caller whose foreground
+    flag was `fg`: background callers get the budget and low priority.
+    """
+    prev = is_foreground()
+    _local.foreground = fg
+    try:
+        with background():
+            return func(*args)
+    finally:
+        _local.foreground = prev
+
+
+# latency backoff
+
+def _sample():
+    import psutil
+    c = psutil.disk_io_counters()
+    return c.read_time + c.write_time, c.read_count + c.write_count
+
+
+def _watch():
+    global _factor
+    try:
+        busy, ops = _sample()
+    except Exception:
+        return
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        threshold = settings().get("backoff_latency_ms", 0)
+        try:
+            busy2, ops2 = _sample()
+        except Exception:
+            return
+        latency = (busy2 - busy) / (ops2 - ops) if ops2 > ops else 0
+        busy, ops = busy2, ops2
+        if threshold and latency > threshold:
+            _factor = max(0.05, _factor / 2)  # back off fast
+        else:
+            _factor = min(1.0, _factor + 0.1)  # recover slowly
+
+
+def _start_monitor():
+    global _monitor
+    if _monitor is None:
+        _monitor = threading.Thread(target=_watch, name="io-latency", daemon=True)
+        _monitor.start()
+
+
+def backoff_factor():
+    """Current share of the configured (or measured) budget, 1.0 = no backoff"""
+    return _factor
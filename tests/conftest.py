@@ -0,0 +1,71 @@
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import config, encryption, storage, throttle
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """A throwaway config.json with backup_dir and source_dir under tmp_path.
+    Returns the (empty) source folder.
+    """
+    monkeypatch.setattr(config, "CONFIG_FILE", tmp_path / "config.json")
+    src = tmp_path / "Claude" / "Network"
+    src.mkdir(parents=True)
+    cfg = config.load_config()
+    cfg["backup_dir"] = str(tmp_path / "backup")
+    cfg["profiles"][config.DEFAULT_PROFILE]["source_dir"] = str(src)
+    config.save_config(cfg)
+    storage._backends.clear()
+    encryption._keys.clear()
+    encryption._passphrases.clear()
+    throttle.reload()
+    yield src
+    storage._backends.clear()
+    encryption._keys.clear()
+    encryption._passphrases.clear()
+
+
+def fill(folder, files=20, size=4096):
+    """Random files, some in a subfolder"""
+    (folder / "sub").mkdir(exist_ok=True)
+    for i in range(files):
+        target = folder / ("sub" if i % 4 == 0 else "") / f"f{i}"
+        target.write_bytes(os.urandom(size + i))
+    (folder / "empty").write_bytes(b"")
+
+
+def same_tree(a, b):
+    files_a = sorted(p.relative_to(a).as_posix() for p in Path(a).rglob("*") if p.is_file())
+    files_b = sorted(p.relative_to(b).as_posix() for p in Path(b).rglob("*") if p.is_file())
+    return files_a == files_b and all((Path(a) / f).read_bytes() == (Path(b) / f).read_bytes() for f in files_a)
+
+
+class Crash(Exception):
+    """Stands in for the process dying mid-operation"""
+
+
+@contextmanager
+def crashing(owner, attr, at=1, after=False):
+    """Make owner.attr raise Crash from its `at`-th call on (`after`: once
+    the real call is done) for the duration of the block
+    """
+    real = getattr(owner, attr)
+    count = [0]
+
+    def wrapper(*args, **kwargs):
+        count[0] += 1
+        if count[0] < at:
+            return real(*args, **kwargs)
+        if after:
+            real(*args, **kwargs)
+        raise Crash(f"{attr} call {count[0]}")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(owner, attr, wrapper)
+        yield count
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from app import config
+from conftest import crashing
+
+
+def test_legacy_keys_move_into_default_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CONFIG_FILE", tmp_path / "config.json")
+    config.CONFIG_FILE.write_text(json.dumps({
+        "backup_dir": str(tmp_path / "backup"),
+        "source_dir": "/old/Network",
+        "claude_path": "/old/Claude.lnk",
+        "current_backup": "work",
+    }), encoding="utf-8")
+
+    cfg = config.load_config()
+    assert "source_dir" not in cfg and "current_backup" not in cfg
+    assert cfg["active_profile"] == config.DEFAULT_PROFILE
+    assert cfg["profiles"][config.DEFAULT_PROFILE] == {
+        "source_dir": "/old/Network", "claude_path": "/old/Claude.lnk", "current_backup": "work"}
+    assert config.get_source_dir() == "/old/Network"
+    assert config.get_current_backup() == "work"
+
+
+def test_profiles_keep_their_own_settings(source):
+    config.add_profile("second", source_dir="/second/Network")
+    assert config.list_profiles() == [config.DEFAULT_PROFILE, "second"]
+    assert config.get_active_profile() == config.DEFAULT_PROFILE
+    # paths not given are copied from the active profile
+    assert config.get_claude_path("second") == config.get_claude_path()
+
+    config.set_current_backup("a")
+    config.set_current_backup("b", profile="second")
+    config.set_active_profile("second")
+    assert config.get_source_dir() == "/second/Network"
+    assert config.get_current_backup() == "b"
+    assert config.get_current_backup(config.DEFAULT_PROFILE) == "a"
+
+    with pytest.raises(ValueError):
+        config.add_profile("second")
+    with pytest.raises(KeyError):
+        config.set_active_profile("missing")
+
+
+def test_removing_the_active_profile_falls_back(source):
+    config.add_profile("second")
+    config.set_active_profile("second")
+    config.remove_profile("second")
+    assert config.list_profiles() == [config.DEFAULT_PROFILE]
+    assert config.get_active_profile() == config.DEFAULT_PROFILE
+    with pytest.raises(ValueError):
+        config.remove_profile(config.DEFAULT_PROFILE)
+
+
+def test_failed_save_keeps_the_previous_file(source):
+    before = config.CONFIG_FILE.read_text(encoding="utf-8")
+    cfg = config.load_config()
+    cfg["io_workers"] = 7
+    with crashing(config.json, "dump"):
+        assert config.save_config(cfg) is False
+    assert config.CONFIG_FILE.read_text(encoding="utf-8") == before
@@ -0,0 +1,97 @@
+import io
+import os
+import struct
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from app import config, encryption, storage
+from conftest import fill, same_tree
+
+KEY = bytes(range(32))
+
+
+def seal(data, chunk_size=encryption.CHUNK_SIZE):
+    return b"".join(encryption.encrypt_stream(io.BytesIO(data), KEY, chunk_size))
+
+
+def unseal(blob):
+    return b"".join(encryption.decrypt_stream(io.BytesIO(blob), KEY))
+
+
+@pytest.mark.parametrize("size", [0, 1, 1000, 4096, 4096 * 3 + 17])
+def test_stream_round_trip(size):
+    data = os.urandom(size)
+    blob = seal(data, chunk_size=4096)
+    assert len(blob) == encryption.encrypted_size(size, 4096)
+    assert unseal(blob) == data
+
+
+def test_files_use_distinct_salts():
+    a, b = seal(b"same"), seal(b"same")
+    header = encryption.HEADER.size
+    assert a[:8] == encryption.MAGIC
+    assert a[12:header] != b[12:header]
+    assert a[header:] != b[header:]
+
+
+def test_tampering_truncation_and_reordering_are_detected():
+    blob = bytearray(seal(os.urandom(4096 * 3), chunk_size=4096))
+    header, record = encryption.HEADER.size, 4096 + encryption.TAG_SIZE
+
+    flipped = bytearray(blob)
+    flipped[header + 100] ^= 1
+    with pytest.raises(ValueError):
+        unseal(bytes(flipped))
+    with pytest.raises(ValueError):
+        unseal(bytes(blob[:header + 2 * record]))  # last chunk dropped
+    swapped = blob[:header] + blob[header + record:header + 2 * record] + blob[header:header + record] + blob[header + 2 * record:]
+    with pytest.raises(ValueError):
+        unseal(bytes(swapped))
+
+
+def test_first_format_still_reads():
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    nonce = os.urandom(8)
+    header = encryption.HEADER_V1.pack(encryption.MAGIC_V1, 4, nonce)
+    blob = header
+    for i, (chunk, final) in enumerate([(b"abcd", False), (b"ef", True)]):
+        blob += AESGCM(KEY).encrypt(nonce + struct.pack(">I", i), chunk, encryption._aad(header, i, final))
+    assert unseal(blob) == b"abcdef"
+
+
+def test_encrypted_local_backup_round_trip(source, tmp_path):
+    fill(source)
+    encryption.setup("secret")
+    backend = storage.get_backend()
+    backend.put("backup-enc-1", source)
+    stored = tmp_path / "backup" / "backup-enc-1"
+    assert (stored / encryption.MARKER).exists()
+    assert (stored / "f1").read_bytes()[:8] == encryption.MAGIC
+    backend.get("backup-enc-1", tmp_path / "out")
+    assert same_tree(source, tmp_path / "out")
+
+
+def test_changing_passphrase_keeps_old_backups_unlockable(source, tmp_path):
+    fill(source, files=3)
+    encryption.setup("old")
+    backend = storage.get_backend()
+    backend.put("backup-old-1", source)
+    with pytest.raises(ValueError):
+        encryption.setup("new")  # current passphrase missing
+    encryption.setup("new", current="old")
+    backend.put("backup-new-1", source)
+    assert len(config.get_encryption()["previous"]) == 1
+
+    # next session
+    encryption._keys.clear()
+    encryption._passphrases.clear()
+    assert not encryption.unlock("wrong")
+    assert encryption.unlock("new")
+    backend.get("backup-new-1", tmp_path / "new")
+    with pytest.raises(RuntimeError):
+        backend.get("backup-old-1", tmp_path / "old")
+    assert encryption.unlock("old")
+    backend.get("backup-old-1", tmp_path / "old2")
+    assert same_tree(source, tmp_path / "old2")
@@ -0,0 +1,113 @@
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("psutil")
+
+from app import config, gui, journal, staging, storage
+from conftest import Crash, crashing, fill, same_tree
+
+
+@pytest.fixture(autouse=True)
+def no_background_staging(monkeypatch):
+    monkeypatch.setattr(staging, "refresh_async", lambda *args: None)
+
+
+def crashed_create(source):
+    with crashing(journal.Journal, "mark", at=8):
+        with pytest.raises(RuntimeError):
+            gui.create_backup("x")
+    [j] = journal.pending()
+    return j
+
+
+def test_interrupted_create_is_hidden_then_resumes(source, monkeypatch):
+    fill(source)
+    j = crashed_create(source)
+    assert gui.list_backups() == []
+    assert j.op == "create" and 0 < len(j.done) < 21
+    done = set(j.done)
+
+    copied = []
+    real_mark = journal.Journal.mark
+    monkeypatch.setattr(journal.Journal, "mark", lambda self, rel, stamp=None: (copied.append(rel), real_mark(self, rel, stamp)))
+    name = gui.resume_operation(j)
+    assert copied and not done & set(copied)
+    assert journal.pending() == []
+    assert [b["name"] for b in gui.list_backups()] == [name]
+    assert same_tree(source, storage.get_backend().local_path(name))
+
+
+def test_resume_skips_only_unchanged_files(source, monkeypatch):
+    fill(source)
+    j = crashed_create(source)
+    done = sorted(j.done)
+    (source / done[0]).write_bytes(b"changed after the crash")
+    (source / done[1]).unlink()
+
+    copied = []
+    real_mark = journal.Journal.mark
+    monkeypatch.setattr(journal.Journal, "mark", lambda self, rel, stamp=None: (copied.append(rel), real_mark(self, rel, stamp)))
+    name = gui.resume_operation(j)
+    assert done[0] in copied
+    assert not set(done[2:]) & set(copied)
+    assert same_tree(source, storage.get_backend().local_path(name))
+
+
+def test_create_crashed_after_rename_completes(source):
+    fill(source, files=3)
+    with crashing(storage.os, "replace", after=True):
+        with pytest.raises(Crash):
+            gui.create_backup("x")
+    [j] = journal.pending()
+    assert gui.resume_operation(j) == j.name
+    assert journal.pending() == []
+    assert same_tree(source, storage.get_backend().local_path(j.name))
+
+
+def test_interrupted_restore_rolls_back_or_resumes(source):
+    fill(source)
+    name = gui.create_backup("x")
+    for f in source.rglob("*"):
+        if f.is_file():
+            f.write_bytes(b"live")
+
+    with crashing(journal.Journal, "mark", at=5):
+        with pytest.raises(RuntimeError):
+            gui.restore_backup(name)
+    assert (source / "f1").read_bytes() == b"live"
+    [j] = journal.pending()
+    gui.rollback_operation(j)
+    assert (source / "f1").read_bytes() == b"live"
+    assert not (source.parent / "Network.incoming").exists()
+    assert journal.pending() == []
+
+    with crashing(journal.Journal, "mark", at=5):
+        with pytest.raises(RuntimeError):
+            gui.restore_backup(name)
+    [j] = journal.pending()
+    gui.resume_operation(j)
+    assert journal.pending() == []
+    assert same_tree(source, storage.get_backend().local_path(name))
+    assert config.get_current_backup() == name
+
+
+def test_locked_encryption_never_writes_plaintext(source):
+    pytest.importorskip("cryptography")
+    from app import encryption
+    fill(source, files=3)
+    encryption.setup("secret")
+    encryption._keys.clear()
+    encryption._passphrases.clear()
+    with pytest.raises(RuntimeError):
+        gui.create_backup("x")
+    assert journal.pending() == []
+
+    # a partial without a marker (crash before it was written)
+    j = journal.start("create", "backup-x-1", profile=config.DEFAULT_PROFILE, source=str(source))
+    storage.get_backend()._partial("backup-x-1").mkdir(parents=True)
+    assert encryption.unlock("secret")
+    with pytest.raises(RuntimeError):
+        gui.resume_operation(j)
+    assert not any(storage.get_backend()._partial("backup-x-1").iterdir())
+    gui.rollback_operation(j)
+    assert journal.pending() == []
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+
+import pytest
+
+from app import encryption, metadata
+
+# Chromium timestamps: microseconds since 1601-01-01
+DAY = 24 * 3600 * 10 ** 6
+NOW = 13_370_000_000 * 10 ** 6
+
+
+def lock():
+    encryption._keys.clear()
+    encryption._passphrases.clear()
+
+
+def cookies_db(folder, rows):
+    """A Cookies database with (host_key, name, value, expires_utc, last_access_utc) rows"""
+    db = folder / "Cookies"
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE cookies (host_key TEXT, name TEXT, value TEXT, "
+                "encrypted_value BLOB, expires_utc INTEGER, last_access_utc INTEGER)")
+    con.executemany("INSERT INTO cookies VALUES (?, ?, ?, x'', ?, ?)", rows)
+    con.commit()
+    con.close()
+    return db
+
+
+def test_only_claude_hosts_are_read(tmp_path):
+    db = cookies_db(tmp_path, [
+        ("claude.ai", "lastActiveOrg", "org-1", NOW + 30 * DAY, NOW - DAY),
+        (".claude.ai", "sessionKey", "sk", NOW + 7 * DAY, NOW),
+        ("evilclaude.ai", "ajs_user_traits", "mallory%40example.com", NOW + 99 * DAY, NOW + DAY),
+        (".evilclaude.ai", "sessionKey", "x", NOW + 99 * DAY, NOW + DAY),
+    ])
+    meta = metadata.read_cookies_db(db)
+    assert meta["account"] == meta["account_id"] == "org-1"
+    assert meta["last_active"] == metadata._chrome_time(NOW)
+    assert meta["expires"] == metadata._chrome_time(NOW + 7 * DAY)
+
+
+def test_email_preferred_over_opaque_id(tmp_path):
+    db = cookies_db(tmp_path, [
+        (".claude.ai", "lastActiveOrg", "org-1", NOW, NOW),
+        (".claude.ai", "ajs_user_traits", "%7B%22email%22%3A%22me%40example.com%22%7D", NOW, NOW),
+    ])
+    meta = metadata.read_cookies_db(db)
+    assert meta["account"] == "me@example.com"
+    assert meta["account_id"] == "org-1"
+
+
+def test_no_cookies_db(tmp_path):
+    assert metadata.extract(tmp_path) == metadata._empty()
+
+
+def test_identity_of_encrypted_backup_is_sealed(source):
+    pytest.importorskip("cryptography")
+    encryption.setup("secret")
+    cookies_db(source, [(".claude.ai", "ajs_user_traits", "me%40example.com", NOW, NOW)])
+    name = "backup-a"
+    assert metadata.capture(name, source)["account"] == "me@example.com"
+
+    raw = metadata._cache_path().read_text(encoding="utf-8")
+    assert "me@example.com" not in raw
+    assert "sealed" in json.loads(raw)[name]
+
+    [opened] = metadata.attach([{"name": name}])
+    assert opened["meta"]["account"] == "me@example.com"
+    lock()
+    [locked] = metadata.attach([{"name": name}])
+    assert locked["meta"].get("account") is None
+    assert locked["meta"]["last_active"] == metadata._chrome_time(NOW)
+
+
+def test_locked_capture_stores_no_identity(source):
+    pytest.importorskip("cryptography")
+    encryption.setup("secret")
+    lock()
+    cookies_db(source, [(".claude.ai", "lastActiveOrg", "org-1", NOW, NOW)])
+    metadata.capture("backup-a", source)
+    stored = metadata.load_cache()["backup-a"]
+    assert "account" not in stored and "account_id" not in stored and "sealed" not in stored
@@ -0,0 +1,69 @@
+import pytest
+
+from app import config, staging, storage
+from conftest import fill
+
+A, B, C = "backup-a", "backup-b", "backup-c"
+
+
+@pytest.fixture
+def backups(source):
+    """Three ~600 KB backups with a 1 MB staging budget; returns the staging root"""
+    cfg = config.load_config()
+    cfg["stage_budget_mb"] = 1
+    config.save_config(cfg)
+    fill(source, files=20, size=32 * 1024)
+    for name in (A, B, C):
+        (source / "who").write_text(name)
+        storage.get_backend().put(name, source)
+    return staging.stage_root()
+
+
+def test_hot_prefers_recent_then_frequent():
+    index = {"history": {
+        "old_favourite": {"hits": 9, "last_used": 1},
+        "yesterday": {"hits": 1, "last_used": 50},
+        "just_now": {"hits": 2, "last_used": 100},
+        "deleted": {"hits": 20, "last_used": 200},
+    }}
+    backups = [{"name": n} for n in ("old_favourite", "yesterday", "just_now", "never")]
+    assert staging._hot(index, backups, 1) == ["just_now"]
+    assert staging._hot(index, backups, 2) == ["just_now", "old_favourite"]
+    # half the slots go to the most recent, the rest to the most frequent
+    assert staging._hot(index, backups, 4) == ["just_now", "yesterday", "old_favourite"]
+
+
+def test_refresh_stages_hot_backups_within_budget(backups):
+    root = backups
+    staging.record_restore(A)
+    staging.record_restore(B)
+    assert staging.refresh() == [B]  # A does not fit next to B
+    assert staging.staged_names() == [B]
+    assert (root / B / "who").read_text() == B
+
+    staging.record_restore(A)
+    assert staging.refresh() == [A]
+    assert staging.staged_names() == [A]
+    assert not (root / B).exists()
+    assert not list(root.glob(".old-*"))
+
+
+def test_pinned_copy_survives_eviction(backups):
+    staging.record_restore(A)
+    staging.refresh()
+    staging.record_restore(B)
+    with staging.pinned(A):
+        staging.refresh()
+        assert A in staging.staged_names()
+    staging.refresh()
+    assert staging.staged_names() == [B]
+
+
+def test_forget_drops_copy_and_history(backups):
+    root = backups
+    staging.record_restore(A)
+    staging.refresh()
+    staging.forget(A)
+    assert staging.staged_names() == []
+    assert not (root / A).exists()
+    assert A not in staging._load(root)["history"]
@@ -0,0 +1,131 @@
+import os
+import socket
+import threading
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto_server = pytest.importorskip("moto.server")
+
+from app import config, storage
+from conftest import crashing, fill, same_tree
+
+BUCKET = "cbm-test"
+
+
+@pytest.fixture(scope="module")
+def endpoint():
+    """A local S3-compatible server"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3(source, endpoint):
+    settings = {"type": "s3", "bucket": BUCKET, "prefix": f"t{os.urandom(4).hex()}/",
+                "endpoint_url": endpoint, "region": "us-east-1",
+                "access_key": "test", "secret_key": "test", "chunk_size_mb": 5}
+    client = boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1",
+                          aws_access_key_id="test", aws_secret_access_key="test")
+    try:
+        client.create_bucket(Bucket=BUCKET)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    cfg = config.load_config()
+    cfg["storage"] = settings
+    config.save_config(cfg)
+    return storage.get_backend()
+
+
+def test_round_trip_and_index(s3, source, tmp_path):
+    fill(source)
+    s3.put("backup-a-1", source)
+    assert [b["name"] for b in s3.list()] == ["backup-a-1"]
+    assert s3.exists("backup-a-1")
+    s3.set_meta("backup-a-1", {"account": "someone"})
+    assert s3.list()[0]["meta"] == {"account": "someone"}
+    s3.get("backup-a-1", tmp_path / "out")
+    assert same_tree(source, tmp_path / "out")
+    s3.delete("backup-a-1")
+    assert s3.list() == []
+
+
+def test_interrupted_upload_resumes_missing_parts(s3, source, tmp_path):
+    fill(source, files=3, size=6 * 1024 * 1024)  # several 5 MB parts
+    with crashing(s3.client, "upload_part", at=2):
+        with pytest.raises(RuntimeError):
+            s3.put("backup-big-1", source)
+    assert s3.list() == []
+    state = s3._state(s3.staging / "backup-big-1.upload.json")
+    assert 0 < len(state["parts"]) < len(s3._ranges((s3.staging / "backup-big-1.tar").stat().st_size))
+
+    sent = []
+    real = s3.client.upload_part
+    s3.client.upload_part = lambda **kw: (sent.append(kw["PartNumber"]), real(**kw))[1]
+    try:
+        s3.put("backup-big-1", source)
+    finally:
+        del s3.client.upload_part
+    assert sent and not set(map(str, sent)) & set(state["parts"])
+    s3.get("backup-big-1", tmp_path / "out")
+    assert same_tree(source, tmp_path / "out")
+
+
+def test_interrupted_download_resumes(s3, source, tmp_path):
+    fill(source, files=3, size=6 * 1024 * 1024)
+    s3.put("backup-big-2", source)
+    with crashing(s3.client, "get_object", at=2):
+        with pytest.raises(RuntimeError):
+            s3.get("backup-big-2", tmp_path / "out")
+    state = s3._state(s3.staging / "backup-big-2.download.json")
+    assert state["done"]
+
+    fetched = []
+    real = s3.client.get_object
+    s3.client.get_object = lambda **kw: (fetched.append(kw.get("Range")), real(**kw))[1]
+    try:
+        s3.get("backup-big-2", tmp_path / "out2")
+    finally:
+        del s3.client.get_object
+    assert len(fetched) == len(s3._ranges(s3.client.head_object(Bucket=BUCKET, Key=s3._key("backup-big-2"))["ContentLength"])) - len(state["done"])
+    assert same_tree(source, tmp_path / "out2")
+
+
+def test_concurrent_index_updates_are_not_lost(s3):
+    # separate backends stand in for separate machines sharing the bucket
+    machines = [storage.S3Backend(bucket=BUCKET, prefix=s3.prefix, endpoint_url=s3.client.meta.endpoint_url,
+                                  region="us-east-1", access_key="test", secret_key="test") for _ in range(6)]
+
+    def create(i, m):
+        for k in range(5):
+            m._update_index(f"backup-{i}-{k}", {"created": "2026-01-01T00:00:00", "size": 1})
+    threads = [threading.Thread(target=create, args=(i, m)) for i, m in enumerate(machines)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(s3.list()) == 30
+
+
+def test_concurrent_gets_of_one_backup(s3, source, tmp_path):
+    fill(source, files=3, size=6 * 1024 * 1024)
+    s3.put("backup-big-3", source)
+    errors = []
+
+    def fetch(i):
+        try:
+            s3.get("backup-big-3", tmp_path / f"out{i}")
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert all(same_tree(source, tmp_path / f"out{i}") for i in range(3))
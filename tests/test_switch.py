@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt6")
+pytest.importorskip("psutil")
+
+from app import config, gui, staging
+from conftest import fill
+
+
+@pytest.fixture(autouse=True)
+def no_claude(monkeypatch):
+    monkeypatch.setattr(staging, "refresh_async", lambda *args: None)
+    monkeypatch.setattr(gui, "terminate_claude", lambda *args, **kwargs: 0)
+    monkeypatch.setattr(gui.time, "sleep", lambda s: None)
+    launched = []
+    monkeypatch.setattr(gui, "start_claude", lambda profile=None: launched.append(profile) or True)
+    return launched
+
+
+def locked_for(monkeypatch, folder, calls):
+    """Renaming `folder` away fails with PermissionError `calls` times"""
+    real = os.replace
+    count = [0]
+
+    def replace(a, b):
+        if str(a) == str(folder):
+            count[0] += 1
+            if count[0] <= calls:
+                raise PermissionError(13, "in use", str(a))
+        return real(a, b)
+    monkeypatch.setattr(os, "replace", replace)
+    return count
+
+
+@pytest.mark.parametrize("staged", [False, True])
+def test_restore_waits_for_lingering_handles(source, monkeypatch, staged):
+    fill(source, files=4)
+    name = gui.create_backup("a")
+    (source / "f1").write_bytes(b"live")
+    if staged:
+        staging.stage(name)
+    count = locked_for(monkeypatch, source, 3)
+    assert gui.restore_backup(name) is staged
+    assert count[0] == 4
+    assert (source / "f1").read_bytes() != b"live"
+    assert not (source.parent / "Network.incoming").exists()
+
+
+def test_switch_swaps_and_relaunches(source, no_claude):
+    (source / "who").write_text("A")
+    a = gui.create_backup("a")
+    (source / "who").write_text("B")
+    timings = gui.switch_to_backup(a)
+    assert (source / "who").read_text() == "A"
+    assert config.get_current_backup() == a
+    assert no_claude == [config.DEFAULT_PROFILE]
+    assert set(timings) == {"stage", "terminate", "swap", "launch", "total"}
+
+
+def test_switch_keeps_pinned_copy_when_nothing_may_be_staged(source, monkeypatch):
+    (source / "who").write_text("A")
+    a = gui.create_backup("a")
+    (source / "who").write_text("B")
+    cfg = config.load_config()
+    cfg["stage_count"] = 0
+    config.save_config(cfg)
+    # a refresh lands between staging and the swap
+    monkeypatch.setattr(gui, "terminate_claude", lambda *args, **kwargs: staging.refresh() and 0)
+    gui.switch_to_backup(a, relaunch=False)
+    assert (source / "who").read_text() == "A"
+
+
+def test_failed_swap_relaunches_claude(source, monkeypatch, no_claude):
+    (source / "who").write_text("A")
+    a = gui.create_backup("a")
+    monkeypatch.setattr(staging, "swap_in", lambda *args: False)
+    with pytest.raises(RuntimeError):
+        gui.switch_to_backup(a)
+    assert no_claude == [config.DEFAULT_PROFILE]
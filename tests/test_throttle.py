@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from app import iopool, throttle
+
+
+class Clock:
+    """Fake monotonic clock; sleeping advances it and is recorded"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def sleep(self, s):
+        self.sleeps.append(round(s, 3))
+        self.now += s
+
+    def advance(self, s):
+        self.now += s
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: c.now)
+    monkeypatch.setattr(throttle.time, "sleep", c.sleep)
+    return c
+
+
+def test_bucket_paces_after_the_burst(clock):
+    bucket = throttle.TokenBucket(rate=1000, burst=100)
+    bucket.consume(100)
+    assert clock.sleeps == []
+    bucket.consume(200)
+    assert clock.sleeps == [0.2]
+    bucket.consume(500)  # larger than the burst: goes into debt, no deadlock
+    assert clock.sleeps == [0.2, 0.5]
+    clock.advance(1.0)
+    bucket.consume(100)
+    assert clock.sleeps == [0.2, 0.5]
+
+
+def test_backoff_factor_scales_the_rate(clock):
+    bucket = throttle.TokenBucket(rate=1000, burst=1)
+    bucket.consume(1)
+    bucket.consume(100, factor=0.5)
+    assert clock.sleeps == [0.2]
+
+
+def test_unlimited_bucket_backs_off_from_measured_throughput(clock):
+    bucket = throttle.TokenBucket()
+    bucket.consume(10_000, factor=0.5)
+    assert clock.sleeps == []  # nothing measured yet: nothing to scale down
+    for _ in range(4):
+        clock.advance(0.5)
+        bucket.consume(1000)
+    assert bucket.measured == pytest.approx(2000)
+    assert clock.sleeps == []
+    bucket.consume(1000, factor=0.5)
+    assert clock.sleeps == [1.0]
+
+
+def test_idle_gaps_are_not_measured(clock):
+    bucket = throttle.TokenBucket()
+    bucket.consume(1000)
+    clock.advance(60)
+    bucket.consume(1000)
+    assert bucket.measured == 0
+
+
+def _task():
+    throttle.consume(nbytes=1000)
+    return throttle.is_foreground(), threading.current_thread().name
+
+
+def test_submit_inherits_the_foreground_flag(source, clock):
+    throttle._bytes.configure(100, burst=1)
+    with throttle.foreground():
+        fg, thread = iopool.submit(_task).result()
+        assert fg and thread.startswith("io-fg")
+        assert clock.sleeps == []
+        fg, thread = iopool.submit(_task, fg=False).result()
+    assert not fg and not thread.startswith("io-fg")
+    assert clock.sleeps == [9.99]
+    assert iopool.submit(_task).result()[0] is False